@@ -2,10 +2,13 @@ import streamlit as st
 import pandas as pd
 from PIL import Image, ImageDraw, ImageFont
 import os
+import io
+import hashlib
 import shutil
-import zipfile
 from datetime import datetime
-from diploma_generator import DiplomaGenerator
+from diploma_generator import (DiplomaGenerator, Metrics, DEFAULT_MODULES, HORAS_POR_MODULO, INPUT_FORMATS,
+                               MODULE_COLUMN_RE, input_format, module_count, read_data)
+from diploma_jobs import Job, JobRunner, WorkspaceManager
 
 # Configuración de la página
 st.set_page_config(
@@ -21,12 +24,41 @@ st.markdown("---")
 # Inicializar session state
 if 'generator' not in st.session_state:
     st.session_state.generator = None
+if 'generator_key' not in st.session_state:
+    st.session_state.generator_key = None
 if 'df' not in st.session_state:
     st.session_state.df = None
 if 'show_coordinates_portada' not in st.session_state:
     st.session_state.show_coordinates_portada = False
 if 'show_coordinates_contra' not in st.session_state:
     st.session_state.show_coordinates_contra = False
+if 'job_id' not in st.session_state:
+    # El id del trabajo va en la URL para recuperarlo al recargar la página
+    st.session_state.job_id = st.query_params.get('job')
+
+# Límites del servidor: trabajos simultáneos entre todas las sesiones y
+# tiempo sin uso tras el que se borra el espacio de trabajo de una sesión
+MAX_TRABAJOS = int(os.environ.get('DIPLOMAS_MAX_TRABAJOS', 2))
+TTL_ESPACIOS = int(os.environ.get('DIPLOMAS_TTL_ESPACIOS', 6 * 3600))
+
+# Ejecutor de trabajos en segundo plano, compartido por todas las sesiones
+@st.cache_resource
+def obtener_runner():
+    return JobRunner(max_workers=MAX_TRABAJOS)
+
+# Espacios de trabajo aislados por sesión (subidas y salida)
+@st.cache_resource
+def obtener_espacios():
+    return WorkspaceManager(os.environ.get('DIPLOMAS_ESPACIOS', 'workspaces'), ttl=TTL_ESPACIOS)
+
+# El espacio de la sesión también va en la URL, para conservarlo al recargar
+if 'workspace_id' not in st.session_state:
+    workspace_id = st.query_params.get('ws')
+    st.session_state.workspace_id = workspace_id if WorkspaceManager.valid_id(workspace_id) else WorkspaceManager.new_id()
+    st.query_params['ws'] = st.session_state.workspace_id
+workspace = obtener_espacios().path(st.session_state.workspace_id)
+obtener_espacios().cleanup(active=obtener_runner().active_workspaces())
+obtener_runner().prune(TTL_ESPACIOS)
 
 # Función para convertir hex a RGB
 def hex_to_rgb(hex_color):
@@ -54,6 +86,92 @@ def draw_preview_with_coords(image, coords_dict, texts_dict):
     
     return img_copy
 
+# Funciones para no repetir trabajo en cada rerun de Streamlit
+def hash_archivo(uploaded_file):
+    """Huella del contenido de un archivo subido"""
+    return hashlib.sha256(uploaded_file.getvalue()).hexdigest()
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def leer_datos(file_hash, _data, formato):
+    """Lee el archivo de datos una sola vez por contenido, solo con las columnas que usa el generador"""
+    return read_data(io.BytesIO(_data), formato)
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+def abrir_imagen(file_hash, _data):
+    """Decodifica la plantilla una sola vez por contenido (no modificar la imagen devuelta)"""
+    img = Image.open(io.BytesIO(_data))
+    img.load()
+    return img
+
+@st.cache_resource(max_entries=8, show_spinner=False)
+def vista_previa_coordenadas(file_hash, _image, coords_dict, texts_dict):
+    """Preview con coordenadas, dibujado solo cuando cambian la plantilla o las coordenadas"""
+    return draw_preview_with_coords(_image, coords_dict, texts_dict)
+
+def guardar_temporal(uploaded_file, file_hash, prefix, extension):
+    """
+    Guarda el archivo subido en el temp/ de la sesión con su huella en el
+    nombre; si ya existe no se reescribe, así las cachés del generador
+    siguen siendo válidas
+    """
+    os.makedirs(f"{workspace}/temp", exist_ok=True)
+    path = f"{workspace}/temp/{prefix}_{file_hash[:16]}.{extension}"
+    if not os.path.exists(path):
+        with open(path, "wb") as f:
+            f.write(uploaded_file.getbuffer())
+    return path
+
+def obtener_generador(portada_path, contraportada_path, output_dir):
+    """
+    Reutiliza el generador de la sesión mientras no cambien las plantillas
+    ni el directorio de salida, conservando sus cachés entre generaciones
+    """
+    key = (portada_path, contraportada_path, output_dir)
+    if st.session_state.generator is None or st.session_state.generator_key != key:
+        st.session_state.generator = DiplomaGenerator(portada_path, contraportada_path, output_dir)
+        st.session_state.generator_key = key
+    return st.session_state.generator
+
+def ruta_fuente(font_file):
+    """Ruta de la fuente del nombre: la subida por el usuario o la de por defecto"""
+    if font_file is not None:
+        return guardar_temporal(font_file, hash_archivo(font_file), "custom_font", "ttf")
+    return "MeaCulpa-Regular.ttf"
+
+def aplicar_fuentes(generator, font_path):
+    """Aplica al generador los tamaños y colores elegidos en el panel lateral"""
+    generator.set_font_config('nombre', size=nombre_size, color=hex_to_rgb(nombre_color), font_name=font_path)
+    generator.set_font_config('folio', size=folio_size, color=hex_to_rgb(folio_color))
+    generator.set_font_config('modulos', size=modulos_size, color=hex_to_rgb(modulos_color))
+    generator.set_font_config('total_horas', size=total_size, color=hex_to_rgb(total_color))
+    generator.set_font_config('promedio_final', size=promedio_size, color=hex_to_rgb(promedio_color))
+
+def generador_vista_previa():
+    """Generador de la sesión con la fuente y colores actuales, para la vista previa en vivo"""
+    generator = obtener_generador(
+        guardar_temporal(portada_file, hash_archivo(portada_file), "portada", "png"),
+        guardar_temporal(contraportada_file, hash_archivo(contraportada_file), "contraportada", "png"),
+        output_dir
+    )
+    aplicar_fuentes(generator, ruta_fuente(font_file))
+    return generator
+
+def controles_vista_previa(key):
+    """Controles de la vista previa en vivo; devuelve (activa, fila, escala)"""
+    df = st.session_state.df
+    if csv_file is None or df is None or len(df) == 0 or portada_file is None or contraportada_file is None:
+        st.caption("Carga las dos plantillas y el CSV para ver un diploma real en la vista previa")
+        return False, 0, 0.25
+    activa = st.checkbox("Vista previa en vivo con un diploma real", value=False, key=f'live_{key}')
+    if not activa:
+        return False, 0, 0.25
+    col_fila, col_escala = st.columns(2)
+    with col_fila:
+        fila = st.number_input("Fila del CSV", value=1, min_value=1, max_value=len(df), key=f'fila_{key}') - 1
+    with col_escala:
+        escala = st.select_slider("Escala", options=[0.15, 0.25, 0.35, 0.5], value=0.25, key=f'escala_{key}')
+    return True, fila, escala
+
 # Función para limpiar directorio de salida
 def limpiar_directorio_salida(output_dir):
     """Elimina todos los archivos generados previamente"""
@@ -69,35 +187,19 @@ def limpiar_directorio_salida(output_dir):
         st.error(f"Error al limpiar directorio: {e}")
         return False
 
-# Función para crear archivo ZIP con los diplomas
-def crear_zip_diplomas(output_dir):
-    """Crea un archivo ZIP con todos los diplomas generados"""
+# Función para la regeneración incremental
+def limpiar_zips_anteriores(output_dir):
+    """Elimina solo los ZIP generados previamente, conservando los diplomas y el manifiesto"""
     try:
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        zip_filename = f"diplomas_{timestamp}.zip"
-        zip_path = os.path.join(output_dir, zip_filename)
-        
-        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            # Agregar todos los PDFs
-            pdf_dir = os.path.join(output_dir, 'pdf')
-            if os.path.exists(pdf_dir):
-                for filename in os.listdir(pdf_dir):
-                    if filename.endswith('.pdf'):
-                        file_path = os.path.join(pdf_dir, filename)
-                        zipf.write(file_path, os.path.join('pdf', filename))
-            
-            # Agregar todos los PNGs
-            png_dir = os.path.join(output_dir, 'png')
-            if os.path.exists(png_dir):
-                for filename in os.listdir(png_dir):
-                    if filename.endswith('.png'):
-                        file_path = os.path.join(png_dir, filename)
-                        zipf.write(file_path, os.path.join('png', filename))
-        
-        return zip_path
+        os.makedirs(f"{output_dir}/png", exist_ok=True)
+        os.makedirs(f"{output_dir}/pdf", exist_ok=True)
+        for archivo in os.listdir(output_dir):
+            if archivo.startswith("diplomas_") and archivo.endswith(".zip"):
+                os.remove(os.path.join(output_dir, archivo))
+        return True
     except Exception as e:
-        st.error(f"Error al crear ZIP: {e}")
-        return None
+        st.error(f"Error al limpiar directorio: {e}")
+        return False
 
 # Sidebar para configuración
 with st.sidebar:
@@ -108,12 +210,41 @@ with st.sidebar:
     
     portada_file = st.file_uploader("Plantilla Portada (PNG)", type=['png'], key='portada')
     contraportada_file = st.file_uploader("Plantilla Contraportada (PNG)", type=['png'], key='contraportada')
-    csv_file = st.file_uploader("Archivo CSV con datos", type=['csv'], key='csv')
+    csv_file = st.file_uploader("Archivo de datos (CSV, Parquet, Feather o Excel)",
+                                type=[extension.lstrip('.') for extension in INPUT_FORMATS], key='csv')
     
     st.markdown("**Fuente personalizada (opcional)**")
     font_file = st.file_uploader("Fuente para el nombre (TTF)", type=['ttf', 'otf'], key='font_file', help="Si no cargas nada, se usará MeaCulpa-Regular.ttf por defecto")
     
-    output_dir = st.text_input("Directorio de salida", value="diplomas_generados")
+    # La salida queda siempre dentro del espacio de trabajo de la sesión
+    carpeta_salida = os.path.basename(os.path.normpath(st.text_input("Carpeta de salida", value="diplomas_generados")))
+    output_dir = os.path.join(workspace, carpeta_salida if carpeta_salida not in ('', '.', '..') else "diplomas_generados")
+    workers = st.number_input("Procesos en paralelo", value=1, min_value=1, max_value=os.cpu_count() or 1,
+                              help="Número de procesos que generan diplomas al mismo tiempo")
+    save_png = st.checkbox("Guardar también las imágenes de cada página", value=True,
+                           help="Si se desmarca, solo se generan los PDF")
+    pdf_unico = st.checkbox("Un solo PDF con todos los diplomas (imprenta)", value=False,
+                            help="Genera un único PDF con la plantilla incrustada una sola vez y el texto de cada estudiante encima")
+    solo_zip = st.checkbox("Solo archivo ZIP (sin archivos sueltos)", value=False,
+                           help="Los diplomas se escriben directamente en el ZIP de descarga")
+    pdf_vectorial = st.checkbox("Texto vectorial en los PDF", value=False,
+                                help="El texto se dibuja con las fuentes incrustadas en lugar de como imagen: más rápido, más nítido y más ligero")
+    regenerar_cambios = st.checkbox("Regenerar solo lo que cambió", value=False,
+                                    help="Conserva los diplomas anteriores y vuelve a generar solo los que cambiaron en los datos, plantillas o configuración (no compatible con PDF único ni solo ZIP)")
+    por_etapas = st.checkbox("Generar por etapas", value=False,
+                             help="Renderizado, codificación, PDF y escritura en hilos separados con colas acotadas (con 1 proceso y sin PDF único)")
+    
+    with st.expander("🖼️ Formato de salida"):
+        formato_imagen = st.selectbox("Formato de las imágenes", ["png", "jpeg", "webp"], index=0,
+                                      help="JPEG y WebP son mucho más rápidos de escribir y más ligeros que PNG")
+        compresion_png = st.slider("Compresión PNG", 0, 9, 6,
+                                   help="Menos compresión = generación más rápida y archivos más grandes")
+        reducir_colores = st.selectbox("Reducir colores (PNG)", ["none", "rgb", "palette"],
+                                       format_func={"none": "No", "rgb": "Quitar alfa si es opaca",
+                                                    "palette": "Paleta de 256 colores"}.get)
+        calidad = st.slider("Calidad JPEG/WebP", 50, 95, 90)
+        pdf_jpeg = st.checkbox("Páginas del PDF en JPEG", value=False,
+                               help="Las páginas se incrustan en el PDF como JPEG sin recomprimir: PDF más rápidos y ligeros")
     
     st.markdown("---")
     
@@ -149,29 +280,32 @@ with tab1:
     
     if csv_file is not None:
         try:
-            df = pd.read_csv(csv_file)
+            df = leer_datos(hash_archivo(csv_file), csv_file.getvalue(), input_format(csv_file.name))
             st.session_state.df = df
             st.dataframe(df, use_container_width=True)
             
             st.info(f"✅ {len(df)} diplomas para generar")
             
             # Validar columnas
-            required_cols = ['nombre', 'folio', 'modulo1_calificacion', 'modulo2_calificacion', 
-                           'modulo3_calificacion', 'modulo4_calificacion']
-            missing_cols = [col for col in required_cols if col not in df.columns]
+            # El número de módulos sale de las columnas moduloN_calificacion
+            missing_cols = [col for col in ('nombre', 'folio') if col not in df.columns]
+            if not any(MODULE_COLUMN_RE.fullmatch(str(col)) for col in df.columns):
+                missing_cols.append('moduloN_calificacion')
             
             if missing_cols:
                 st.error(f"❌ Faltan columnas: {', '.join(missing_cols)}")
             else:
-                st.success("✅ Formato del CSV correcto")
+                modulos = module_count(df.columns)
+                st.success(f"✅ Formato de los datos correcto: {modulos} módulos, "
+                           f"{HORAS_POR_MODULO * modulos} horas en total")
                 
         except Exception as e:
-            st.error(f"Error al leer CSV: {e}")
+            st.error(f"Error al leer los datos: {e}")
     else:
-        st.info("👆 Sube un archivo CSV para comenzar")
+        st.info("👆 Sube un archivo de datos (CSV, Parquet, Feather o Excel) para comenzar")
         
         # Mostrar ejemplo de formato
-        with st.expander("Ver formato del CSV requerido"):
+        with st.expander("Ver columnas requeridas"):
             ejemplo_df = pd.DataFrame({
                 'nombre': ['Juan Pérez', 'María García'],
                 'folio': ['001', '002'],
@@ -187,7 +321,8 @@ with tab2:
     st.subheader("📐 Configurar Coordenadas - Portada")
     
     if portada_file is not None:
-        portada_image = Image.open(portada_file)
+        portada_hash = hash_archivo(portada_file)
+        portada_image = abrir_imagen(portada_hash, portada_file.getvalue())
         img_width, img_height = portada_image.size
         
         st.info(f"Dimensiones de la imagen: {img_width} x {img_height} píxeles")
@@ -212,8 +347,16 @@ with tab2:
         
         with col1:
             st.markdown("### 👁️ Vista Previa")
+            live, fila, escala = controles_vista_previa('portada')
             
-            if st.session_state.show_coordinates_portada:
+            if live:
+                generator = generador_vista_previa()
+                generator.set_portada_coordinates(nombre_x=nombre_x, nombre_y=nombre_y,
+                                                  folio_x=folio_x, folio_y=folio_y)
+                preview_img = generator.render_preview(st.session_state.df.iloc[fila].to_dict(), 'portada', escala)
+                st.image(preview_img, use_column_width=True)
+                st.caption("✍️ Diploma real a resolución reducida; se actualiza al cambiar coordenadas y fuentes")
+            elif st.session_state.show_coordinates_portada:
                 coords = {
                     'nombre': (nombre_x, nombre_y),
                     'folio': (folio_x, folio_y)
@@ -222,7 +365,7 @@ with tab2:
                     'nombre': 'Nombre',
                     'folio': 'Folio'
                 }
-                preview_img = draw_preview_with_coords(portada_image, coords, labels)
+                preview_img = vista_previa_coordenadas(portada_hash, portada_image, coords, labels)
                 st.image(preview_img, use_column_width=True)
                 st.caption("🔴 Las cruces rojas indican dónde se colocarán los elementos")
             else:
@@ -236,7 +379,8 @@ with tab3:
     st.subheader("📐 Configurar Coordenadas - Contraportada")
     
     if contraportada_file is not None:
-        contraportada_image = Image.open(contraportada_file)
+        contraportada_hash = hash_archivo(contraportada_file)
+        contraportada_image = abrir_imagen(contraportada_hash, contraportada_file.getvalue())
         img_width, img_height = contraportada_image.size
         
         st.info(f"Dimensiones de la imagen: {img_width} x {img_height} píxeles")
@@ -268,33 +412,35 @@ with tab3:
         
         with col1:
             st.markdown("### 👁️ Vista Previa")
+            live, fila, escala = controles_vista_previa('contra')
             
-            if st.session_state.show_coordinates_contra:
-                coords = {
-                    'mod1_horas': (mod_base_x, mod_base_y),
-                    'mod2_horas': (mod_base_x, mod_base_y + incremento_y),
-                    'mod3_horas': (mod_base_x, mod_base_y + incremento_y * 2),
-                    'mod4_horas': (mod_base_x, mod_base_y + incremento_y * 3),
-                    'mod1_calif': (calif_base_x, calif_base_y),
-                    'mod2_calif': (calif_base_x, calif_base_y + incremento_y),
-                    'mod3_calif': (calif_base_x, calif_base_y + incremento_y * 2),
-                    'mod4_calif': (calif_base_x, calif_base_y + incremento_y * 3),
-                    'total': (total_x, total_y),
-                    'promedio': (promedio_x, promedio_y)
-                }
-                labels = {
-                    'mod1_horas': 'Mod1-H',
-                    'mod2_horas': 'Mod2-H',
-                    'mod3_horas': 'Mod3-H',
-                    'mod4_horas': 'Mod4-H',
-                    'mod1_calif': 'Mod1-C',
-                    'mod2_calif': 'Mod2-C',
-                    'mod3_calif': 'Mod3-C',
-                    'mod4_calif': 'Mod4-C',
-                    'total': 'Total',
-                    'promedio': 'Promedio'
-                }
-                preview_img = draw_preview_with_coords(contraportada_image, coords, labels)
+            if live:
+                generator = generador_vista_previa()
+                generator.set_contraportada_coordinates(
+                    mod_base_x=mod_base_x, mod_base_y=mod_base_y,
+                    calif_base_x=calif_base_x, calif_base_y=calif_base_y,
+                    incremento_y=incremento_y,
+                    total_x=total_x, total_y=total_y,
+                    promedio_x=promedio_x, promedio_y=promedio_y
+                )
+                preview_img = generator.render_preview(st.session_state.df.iloc[fila].to_dict(), 'contraportada', escala)
+                st.image(preview_img, use_column_width=True)
+                st.caption("✍️ Diploma real a resolución reducida; se actualiza al cambiar coordenadas y fuentes")
+            elif st.session_state.show_coordinates_contra:
+                modulos = (module_count(st.session_state.df.columns) if st.session_state.df is not None
+                           else DEFAULT_MODULES)
+                coords = {}
+                labels = {}
+                for i in range(1, modulos + 1):
+                    coords[f'mod{i}_horas'] = (mod_base_x, mod_base_y + incremento_y * (i - 1))
+                    coords[f'mod{i}_calif'] = (calif_base_x, calif_base_y + incremento_y * (i - 1))
+                    labels[f'mod{i}_horas'] = f'Mod{i}-H'
+                    labels[f'mod{i}_calif'] = f'Mod{i}-C'
+                coords['total'] = (total_x, total_y)
+                coords['promedio'] = (promedio_x, promedio_y)
+                labels['total'] = 'Total'
+                labels['promedio'] = 'Promedio'
+                preview_img = vista_previa_coordenadas(contraportada_hash, contraportada_image, coords, labels)
                 st.image(preview_img, use_column_width=True)
                 st.caption("🔴 Las cruces rojas indican dónde se colocarán los elementos")
             else:
@@ -303,6 +449,105 @@ with tab3:
     else:
         st.warning("⚠️ Primero carga la imagen de la contraportada en el panel lateral")
 
+def mostrar_resultado(job):
+    """Resumen, métricas, descarga del ZIP y vista previa de un trabajo terminado"""
+    output_dir = job.info['output_dir']
+    zip_path = job.info['zip_path']
+    
+    if job.status == Job.DONE:
+        st.success(f"✅ ¡{job.result} diplomas generados exitosamente!")
+        if st.session_state.get('celebrado') != job.id:
+            st.session_state.celebrado = job.id
+            st.balloons()
+    elif job.status == Job.CANCELLED:
+        st.warning(f"⏹️ Generación cancelada: {job.result or 0} de {job.total} diplomas generados")
+    else:
+        st.error(f"❌ Error durante la generación: {job.error}")
+        st.code(job.traceback)
+        return
+    
+    if job.errors:
+        with st.expander(f"⚠️ {len(job.errors)} diplomas con error"):
+            for nombre, error in job.errors:
+                st.error(f"Error procesando {nombre}: {error}")
+    
+    # Tiempos por etapa de la generación
+    resumen = job.info.get('metrics')
+    if resumen:
+        with st.expander(f"⏱️ Métricas: {resumen['seconds']:.1f} s, {resumen['rows_per_sec'] or 0:.1f} diplomas/s"):
+            etapas = pd.DataFrame(resumen['stages']).T
+            if not etapas.empty:
+                st.dataframe(etapas, use_container_width=True)
+            st.caption(" · ".join(f"{tipo.upper()}: {total / (1024 * 1024):.1f} MB"
+                                  for tipo, total in resumen['bytes'].items()))
+            if resumen.get('pipeline'):
+                # Ocupación de cada etapa y profundidad de su cola de entrada
+                st.dataframe(pd.DataFrame(resumen['pipeline']).T, use_container_width=True)
+    
+    # El ZIP se escribe durante la generación
+    if os.path.exists(zip_path):
+        st.success("✅ Archivo ZIP creado correctamente")
+        
+        # Botón de descarga del ZIP
+        with open(zip_path, 'rb') as f:
+            st.download_button(
+                label="📥 Descargar todos los diplomas (ZIP)",
+                data=f,
+                file_name=os.path.basename(zip_path),
+                mime="application/zip",
+                type="primary",
+                use_container_width=True
+            )
+    else:
+        st.error("❌ No se pudo crear el archivo ZIP")
+    
+    # Mostrar ubicación de archivos
+    st.info(f"📁 Los diplomas se guardaron en: `{output_dir}/`")
+    
+    # Mostrar preview del primer diploma generado
+    if os.path.exists(f"{output_dir}/png"):
+        png_files = [f for f in os.listdir(f"{output_dir}/png") if '_portada.' in f]
+        if png_files:
+            st.subheader("Vista previa del primer diploma generado:")
+            col1, col2 = st.columns(2)
+            with col1:
+                preview_portada = Image.open(f"{output_dir}/png/{png_files[0]}")
+                st.image(preview_portada, caption="Portada", use_column_width=True)
+            with col2:
+                contraportada_file_name = png_files[0].replace('_portada.', '_contraportada.')
+                if os.path.exists(f"{output_dir}/png/{contraportada_file_name}"):
+                    preview_contra = Image.open(f"{output_dir}/png/{contraportada_file_name}")
+                    st.image(preview_contra, caption="Contraportada", use_column_width=True)
+
+def panel_trabajo(job_id, polling):
+    """
+    Estado del trabajo de la sesión. Mientras corre se consulta una vez por
+    segundo (fragmento con run_every) en lugar de enviar cada fila al navegador.
+    """
+    runner = obtener_runner()
+    job = runner.get(job_id)
+    if job is None:
+        return
+    
+    if job.active:
+        total = job.total or 1
+        st.progress(min(job.completed / total, 1.0))
+        if job.status == Job.PENDING:
+            st.text(f"En cola: el servidor genera como máximo {MAX_TRABAJOS} lotes a la vez...")
+        else:
+            st.text(f"Procesando: {job.current or '...'} ({job.completed}/{job.total})")
+            st.caption(f"⏱️ {job.rate:.1f} diplomas/s · {len(job.errors)} con error")
+        if job.cancel_event.is_set():
+            st.caption("Cancelando tras el diploma en curso...")
+        elif st.button("⏹️ Cancelar generación", key='cancelar_trabajo'):
+            runner.cancel(job.id)
+        return
+    
+    if polling:
+        # Terminó mientras se consultaba: se recarga la página para dejar de consultar
+        st.rerun()
+    mostrar_resultado(job)
+
 # TAB 4: Generar
 with tab4:
     st.subheader("🚀 Generar Diplomas")
@@ -311,7 +556,7 @@ with tab4:
     ready_checks = {
         "Portada cargada": portada_file is not None,
         "Contraportada cargada": contraportada_file is not None,
-        "CSV cargado": csv_file is not None
+        "Datos cargados": csv_file is not None
     }
     
     col1, col2 = st.columns(2)
@@ -338,55 +583,46 @@ with tab4:
     
     st.markdown("---")
     
+    job = obtener_runner().get(st.session_state.job_id) if st.session_state.job_id else None
+    en_curso = job is not None and job.active
+    
     if all(ready_checks.values()):
-        generate_btn = st.button("🎓 Generar Todos los Diplomas", type="primary", use_container_width=True)
+        generate_btn = st.button("🎓 Generar Todos los Diplomas", type="primary", use_container_width=True,
+                                 disabled=en_curso)
         
         if generate_btn:
             try:
-                # Limpiar diplomas anteriores para no desbordar la memoria
-                with st.spinner('🗑️ Limpiando diplomas anteriores...'):
-                    if not limpiar_directorio_salida(output_dir):
-                        st.error("No se pudo limpiar el directorio. Abortando generación.")
+                incremental = regenerar_cambios and not pdf_unico and not solo_zip
+                if incremental:
+                    # Se conservan los diplomas anteriores; solo se descartan los ZIP viejos
+                    if not limpiar_zips_anteriores(output_dir):
+                        st.error("No se pudo preparar el directorio. Abortando generación.")
                         st.stop()
-                    st.success("✅ Directorio limpiado correctamente")
-                
-                # Guardar archivos temporalmente
-                os.makedirs("temp", exist_ok=True)
-                
-                portada_path = "temp/portada_temp.png"
-                contraportada_path = "temp/contraportada_temp.png"
-                csv_path = "temp/data_temp.csv"
-                
-                with open(portada_path, "wb") as f:
-                    f.write(portada_file.getbuffer())
-                
-                with open(contraportada_path, "wb") as f:
-                    f.write(contraportada_file.getbuffer())
+                else:
+                    # Limpiar diplomas anteriores para no desbordar la memoria
+                    with st.spinner('🗑️ Limpiando diplomas anteriores...'):
+                        if not limpiar_directorio_salida(output_dir):
+                            st.error("No se pudo limpiar el directorio. Abortando generación.")
+                            st.stop()
                 
-                with open(csv_path, "wb") as f:
-                    f.write(csv_file.getbuffer())
+                # Guardar archivos temporalmente (solo si su contenido cambió)
+                portada_path = guardar_temporal(portada_file, hash_archivo(portada_file), "portada", "png")
+                contraportada_path = guardar_temporal(contraportada_file, hash_archivo(contraportada_file),
+                                                      "contraportada", "png")
+                # Con su extensión original: el generador elige el lector por ella
+                csv_path = guardar_temporal(csv_file, hash_archivo(csv_file), "data",
+                                            os.path.splitext(csv_file.name)[1].lstrip('.').lower() or "csv")
                 
                 # Guardar fuente personalizada si fue cargada
-                font_path = None
-                if font_file is not None:
-                    font_path = "temp/custom_font.ttf"
-                    with open(font_path, "wb") as f:
-                        f.write(font_file.getbuffer())
-                    st.info(f"🔤 Usando fuente personalizada: {font_file.name}")
-                else:
-                    # Usar la fuente por defecto
-                    font_path = "MeaCulpa-Regular.ttf"
-                    st.info("🔤 Usando fuente por defecto: MeaCulpa-Regular.ttf")
+                font_path = ruta_fuente(font_file)
                 
-                # Crear generador
-                generator = DiplomaGenerator(portada_path, contraportada_path, output_dir)
+                # Crear generador (o reutilizar el de la sesión)
+                generator = obtener_generador(portada_path, contraportada_path, output_dir)
                 
                 # Aplicar personalizaciones de colores y fuentes
-                generator.set_font_config('nombre', size=nombre_size, color=hex_to_rgb(nombre_color), font_name=font_path)
-                generator.set_font_config('folio', size=folio_size, color=hex_to_rgb(folio_color))
-                generator.set_font_config('modulos', size=modulos_size, color=hex_to_rgb(modulos_color))
-                generator.set_font_config('total_horas', size=total_size, color=hex_to_rgb(total_color))
-                generator.set_font_config('promedio_final', size=promedio_size, color=hex_to_rgb(promedio_color))
+                aplicar_fuentes(generator, font_path)
+                generator.set_output_config(format=formato_imagen, compress_level=compresion_png,
+                                            reduce=reducir_colores, quality=calidad, pdf_jpeg=pdf_jpeg)
                 
                 # Aplicar coordenadas personalizadas - PORTADA
                 generator.set_portada_coordinates(
@@ -409,91 +645,45 @@ with tab4:
                     promedio_y=promedio_y
                 )
                 
-                # Generar diplomas con barra de progreso
-                with st.spinner('Generando diplomas...'):
-                    progress_bar = st.progress(0)
-                    status_text = st.empty()
-                    
-                    df = pd.read_csv(csv_path)
-                    total = len(df)
-                    
-                    for index, row in df.iterrows():
-                        try:
-                            nombre = row['nombre']
-                            folio = str(row['folio'])
-                            
-                            safe_name = "".join(c for c in nombre if c.isalnum() or c in (' ', '-', '_')).rstrip()
-                            portada_png = f"{output_dir}/png/{safe_name}_portada.png"
-                            contraportada_png = f"{output_dir}/png/{safe_name}_contraportada.png"
-                            diploma_pdf = f"{output_dir}/pdf/{safe_name}_diploma.pdf"
-                            
-                            generator.create_portada(nombre, folio, portada_png)
-                            generator.create_contraportada(row.to_dict(), contraportada_png)
-                            generator.create_pdf(portada_png, contraportada_png, diploma_pdf)
-                            
-                            progress = (index + 1) / total
-                            progress_bar.progress(progress)
-                            status_text.text(f"Procesando: {nombre} ({index + 1}/{total})")
-                            
-                        except Exception as e:
-                            st.error(f"Error procesando {row.get('nombre', 'desconocido')}: {e}")
-                    
-                    progress_bar.progress(1.0)
-                    status_text.text("¡Completado!")
-                
-                st.success(f"✅ ¡{total} diplomas generados exitosamente!")
+                # El trabajo usa su propia copia: la vista previa puede seguir
+                # cambiando el generador de la sesión mientras tanto
+                job_generator = DiplomaGenerator.from_config(generator.get_config())
+                merged_pdf = f"{output_dir}/pdf/diplomas_completos.pdf" if pdf_unico else None
+                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+                zip_path = os.path.join(output_dir, f"diplomas_{timestamp}.zip")
+                opciones = dict(workers=workers, save_png=save_png, merged_pdf=merged_pdf,
+                                pdf_mode='vector' if pdf_vectorial else 'raster', zip_path=zip_path,
+                                write_files=not solo_zip, incremental=incremental,
+                                pipeline=por_etapas and workers == 1)
                 
-                # Crear archivo ZIP con todos los diplomas
-                with st.spinner('📦 Creando archivo ZIP para descarga...'):
-                    zip_path = crear_zip_diplomas(output_dir)
-                    
-                    if zip_path and os.path.exists(zip_path):
-                        st.success("✅ Archivo ZIP creado correctamente")
-                        
-                        # Botón de descarga del ZIP
-                        with open(zip_path, 'rb') as f:
-                            st.download_button(
-                                label="📥 Descargar todos los diplomas (ZIP)",
-                                data=f,
-                                file_name=os.path.basename(zip_path),
-                                mime="application/zip",
-                                type="primary",
-                                use_container_width=True
-                            )
-                    else:
-                        st.error("❌ No se pudo crear el archivo ZIP")
+                def generar(job):
+                    job_generator.metrics = Metrics()
+                    generados = job_generator.generate_diplomas(csv_path, progress_callback=job.progress,
+                                                                cancel_event=job.cancel_event, **opciones)
+                    job.info['metrics'] = job_generator.metrics.summary()
+                    return generados
                 
-                st.balloons()
-                
-                # Mostrar ubicación de archivos
-                st.info(f"📁 Los diplomas se guardaron en: `{output_dir}/`")
-                
-                # Mostrar preview del primer diploma generado
-                if os.path.exists(f"{output_dir}/png"):
-                    png_files = [f for f in os.listdir(f"{output_dir}/png") if f.endswith('_portada.png')]
-                    if png_files:
-                        st.subheader("Vista previa del primer diploma generado:")
-                        col1, col2 = st.columns(2)
-                        with col1:
-                            preview_portada = Image.open(f"{output_dir}/png/{png_files[0]}")
-                            st.image(preview_portada, caption="Portada", use_column_width=True)
-                        with col2:
-                            contraportada_file_name = png_files[0].replace('_portada.png', '_contraportada.png')
-                            if os.path.exists(f"{output_dir}/png/{contraportada_file_name}"):
-                                preview_contra = Image.open(f"{output_dir}/png/{contraportada_file_name}")
-                                st.image(preview_contra, caption="Contraportada", use_column_width=True)
+                job = obtener_runner().submit(generar, output_dir=output_dir, zip_path=zip_path,
+                                              workspace=workspace)
+                st.session_state.job_id = job.id
+                st.query_params['job'] = job.id
+                st.rerun()
                 
             except Exception as e:
                 st.error(f"❌ Error durante la generación: {e}")
                 st.exception(e)
     else:
         st.warning("⚠️ Completa todos los pasos anteriores antes de generar")
+    
+    # Progreso o resultado del último trabajo de la sesión
+    if job is not None:
+        st.fragment(run_every=1.0 if en_curso else None)(panel_trabajo)(job.id, en_curso)
 
 # Footer
 st.markdown("---")
 st.markdown("""
 <div style='text-align: center; color: #666;'>
     <p>💡 <strong>Pasos:</strong> 1) Cargar archivos 2) Configurar coordenadas 3) Personalizar colores 4) Generar</p>
-    <p>Cada módulo tiene 30 horas fijas | Total: 120 horas</p>
+    <p>Cada módulo tiene 30 horas fijas | Total: 30 horas × número de módulos del CSV</p>
 </div>
 """, unsafe_allow_html=True)
\ No newline at end of file
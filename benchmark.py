@@ -0,0 +1,392 @@
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from diploma_generator import DiplomaGenerator, ArchiveWriter
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# ============================================================
+# DATOS Y PLANTILLAS SINTÉTICAS
+# ============================================================
+
+# Tamaños de roster predefinidos
+ROSTER_SIZES = (1, 100, 10000, 100000)
+
+# Resoluciones de plantilla habituales (ancho, alto) en píxeles
+RESOLUTIONS = {
+    'a4-150': (1240, 1754),
+    'a4-300': (2480, 3508),
+    'letter-300': (2550, 3300)
+}
+
+NOMBRES = ['Ana', 'Juan', 'María', 'José', 'Luis', 'Carmen', 'Sofía', 'Miguel', 'Guadalupe', 'Fernanda',
+           'Alejandro', 'Valentina', 'Maximiliano', 'Li Wei', 'Ximena', 'Óscar', 'Iñaki', 'Renata']
+APELLIDOS = ['Pérez', 'García', 'López', 'Hernández', 'Martínez', 'González', 'Rodríguez', 'Ñúñez',
+             'Sánchez', 'Ramírez', 'Torres', 'Zhang', 'Villaseñor', 'Castañeda', 'Echeverría', 'Ortiz']
+PARTICULAS = ['de la', 'del', 'de los', 'y']
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def synthetic_name(rng):
+    """
+    Nombre con una distribución de longitudes parecida a la real: uno o dos
+    nombres, casi siempre dos apellidos y a veces apellidos compuestos
+    """
+    partes = rng.sample(NOMBRES, 2 if rng.random() < 0.4 else 1)
+    for _ in range(2 if rng.random() < 0.9 else 1):
+        if rng.random() < 0.08:
+            partes.append(rng.choice(PARTICULAS))
+        partes.append(rng.choice(APELLIDOS))
+    return ' '.join(partes)
+
+
+def write_synthetic_csv(path, rows, seed=0):
+    """Escribe un CSV de datos con el formato que espera el generador"""
+    rng = random.Random(seed)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('nombre,folio,modulo1_calificacion,modulo2_calificacion,modulo3_calificacion,modulo4_calificacion\n')
+        for i in range(rows):
+            calificaciones = ['NP' if rng.random() < 0.02 else f"{rng.uniform(6, 10):.1f}" for _ in range(4)]
+            f.write(f"{synthetic_name(rng)} {i},{i:06d},{','.join(calificaciones)}\n")
+    return path
+
+
+def write_synthetic_template(path, size, seed=0):
+    """
+    Escribe una plantilla PNG con degradado, adornos y un marco, que comprime
+    de forma parecida a un diseño real (ni un color plano ni ruido por píxel)
+    """
+    width, height = size
+    rng = random.Random(seed)
+    gradient = np.linspace(0, 40, height, dtype=np.float32)[:, None, None]
+    pixels = np.array([238, 232, 220], dtype=np.float32) - gradient
+    img = Image.fromarray(np.broadcast_to(pixels, (height, width, 3)).astype(np.uint8), 'RGB')
+
+    draw = ImageDraw.Draw(img)
+    for _ in range(40):
+        x, y = rng.randrange(width), rng.randrange(height)
+        radius = rng.randrange(width // 40, width // 6)
+        shade = rng.randrange(200, 235)
+        draw.ellipse([x - radius, y - radius, x + radius, y + radius], outline=(shade, shade - 10, shade - 25),
+                     width=max(1, width // 600))
+    margin = width // 20
+    for i in range(3):
+        inset = margin + i * width // 100
+        draw.rectangle([inset, inset, width - inset, height - inset], outline=(10, 98, 126), width=max(1, width // 400))
+    img.save(path, format='PNG')
+    return path
+
+
+# ============================================================
+# MEDICIONES
+# ============================================================
+
+def percentiles(samples):
+    """p50 y p95 en milisegundos de una lista de duraciones en segundos"""
+    if not samples:
+        return {'p50_ms': None, 'p95_ms': None}
+    values = np.array(samples) * 1000
+    return {'p50_ms': round(float(np.percentile(values, 50)), 3),
+            'p95_ms': round(float(np.percentile(values, 95)), 3)}
+
+
+def peak_rss_mb():
+    """Memoria residente máxima del proceso y de sus hijos, en MB (None si no se puede medir)"""
+    if resource is None:
+        return None
+    # ru_maxrss está en KB en Linux y en bytes en macOS
+    unit = 1 if sys.platform == 'darwin' else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * unit
+    return round(max(own, children) / (1024 * 1024), 1)
+
+
+def make_generator(portada, contraportada, output_dir):
+    """Generador con las fuentes del repositorio, sin depender del directorio actual"""
+    generator = DiplomaGenerator(portada, contraportada, output_dir)
+    for element, config in generator.get_font_configs().items():
+        bundled = os.path.join(ROOT, config['font_name'])
+        if os.path.exists(bundled):
+            generator.set_font_config(element, font_name=bundled)
+    return generator
+
+
+def bench_end_to_end(case):
+    """
+    Ejecuta generate_diplomas completo sobre un roster sintético. Se llama en
+    un proceso nuevo por caso para que la memoria máxima sea la del caso.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = write_synthetic_csv(os.path.join(tmp, 'datos.csv'), case['rows'], case['seed'])
+        portada = write_synthetic_template(os.path.join(tmp, 'portada.png'), case['size'], case['seed'])
+        contraportada = write_synthetic_template(os.path.join(tmp, 'contraportada.png'), case['size'], case['seed'] + 1)
+        output_dir = os.path.join(tmp, 'salida')
+        zip_path = os.path.join(tmp, 'diplomas.zip') if case['zip'] else None
+
+        marcas = []
+        errores = []
+
+        def progreso(completados, total, nombre, error):
+            marcas.append(time.perf_counter())
+            if error is not None:
+                errores.append(str(error))
+
+        generator = make_generator(portada, contraportada, output_dir)
+        start = time.perf_counter()
+        generados = generator.generate_diplomas(csv_path, workers=case['workers'], progress_callback=progreso,
+                                                save_png=case['save_png'], pdf_mode=case['pdf_mode'],
+                                                zip_path=zip_path, pipeline=case['pipeline'])
+        elapsed = time.perf_counter() - start
+
+        # Latencia por diploma: tiempo entre filas terminadas consecutivas
+        latencias = np.diff([start] + marcas).tolist()
+        return dict(
+            case,
+            generated=generados,
+            errors=len(errores),
+            seconds=round(elapsed, 3),
+            rows_per_sec=round(case['rows'] / elapsed, 2) if elapsed else None,
+            latency=percentiles(latencias),
+            peak_rss_mb=peak_rss_mb(),
+            metrics=generator.metrics.summary()
+        )
+
+
+def bench_stages(size, samples, seed=0):
+    """Mide cada etapa por separado sobre las mismas filas sintéticas"""
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = write_synthetic_csv(os.path.join(tmp, 'datos.csv'), samples, seed)
+        portada = write_synthetic_template(os.path.join(tmp, 'portada.png'), size, seed)
+        contraportada = write_synthetic_template(os.path.join(tmp, 'contraportada.png'), size, seed + 1)
+
+        tiempos = {'create_portada': [], 'create_contraportada': [], 'png_encode': [], 'create_pdf': [], 'zip': []}
+        bytes_escritos = {'png': 0, 'pdf': 0}
+
+        generator = make_generator(portada, contraportada, os.path.join(tmp, 'salida'))
+        registros = generator.prepare_records(generator.load_data(csv_path))
+        archive = ArchiveWriter(os.path.join(tmp, 'etapas.zip'))
+
+        for registro in registros:
+            start = time.perf_counter()
+            img_portada = generator.create_portada(registro.nombre, registro.folio)
+            tiempos['create_portada'].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            img_contraportada = generator.create_contraportada(registro)
+            tiempos['create_contraportada'].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            png = io.BytesIO()
+            img_portada.save(png, format='PNG')
+            tiempos['png_encode'].append(time.perf_counter() - start)
+            bytes_escritos['png'] += png.tell()
+
+            start = time.perf_counter()
+            pdf = io.BytesIO()
+            generator.create_pdf(img_portada, img_contraportada, pdf)
+            tiempos['create_pdf'].append(time.perf_counter() - start)
+            bytes_escritos['pdf'] += pdf.tell()
+
+            start = time.perf_counter()
+            archive.write(f"pdf/{registro.safe_name}_diploma.pdf", pdf.getvalue())
+            archive.write(f"png/{registro.safe_name}_portada.png", png.getvalue())
+            tiempos['zip'].append(time.perf_counter() - start)
+        archive.close()
+
+        return {
+            'stages': {stage: dict(percentiles(values), total_s=round(sum(values), 3))
+                       for stage, values in tiempos.items()},
+            'bytes': bytes_escritos,
+            'samples': samples
+        }
+
+
+# Módulos pesados que no deben cargarse solo por importar el generador
+HEAVY_MODULES = ('pandas', 'numpy', 'reportlab')
+
+# Los que sí necesita un trabajo pequeño por línea de comandos (el PDF)
+JOB_MODULES = ('reportlab',)
+
+
+def _timed_run(command, samples, cwd=ROOT):
+    """Mediana en milisegundos de ejecutar un comando en un proceso nuevo"""
+    tiempos = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=cwd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        tiempos.append(time.perf_counter() - start)
+    return round(float(np.median(tiempos)) * 1000, 1)
+
+
+def _heavy_modules(code, cwd=ROOT):
+    """Módulos de HEAVY_MODULES cargados al terminar de ejecutar el código en un intérprete nuevo"""
+    code = f"{code}\nimport json, sys\nprint(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))"
+    salida = subprocess.run([sys.executable, '-c', code], cwd=cwd, capture_output=True, text=True, check=True).stdout
+    return json.loads(salida.strip().splitlines()[-1])
+
+
+def bench_startup(samples=5, seed=0):
+    """
+    Mide el arranque en frío: importar el generador, --help, y un trabajo de
+    una fila por la línea de comandos. Cada muestra es un intérprete nuevo;
+    'python' es el coste de arrancar Python sin importar nada. También
+    registra qué módulos pesados quedan cargados tras importar el generador
+    y tras el trabajo de una fila (que solo debería cargar JOB_MODULES).
+    """
+    script = os.path.join(ROOT, 'diploma_generator.py')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = write_synthetic_csv(os.path.join(tmp, 'datos.csv'), 1, seed)
+        portada = write_synthetic_template(os.path.join(tmp, 'portada.png'), RESOLUTIONS['a4-150'], seed)
+        contraportada = write_synthetic_template(os.path.join(tmp, 'contraportada.png'), RESOLUTIONS['a4-150'],
+                                                 seed + 1)
+        job_args = ['--csv', csv_path, '--portada', portada, '--contraportada', contraportada,
+                    '--output', os.path.join(tmp, 'salida'), '--log-level', 'ERROR']
+        # El mismo trabajo, ejecutado como __main__ para poder mirar sys.modules al final
+        job_code = (f"import runpy, sys\nsys.argv = {[script] + job_args!r}\n"
+                    f"runpy.run_path({script!r}, run_name='__main__')")
+        resultado = {
+            'samples': samples,
+            'python_ms': _timed_run([sys.executable, '-c', 'pass'], samples),
+            'import_ms': _timed_run([sys.executable, '-c', 'import diploma_generator'], samples),
+            'help_ms': _timed_run([sys.executable, script, '--help'], samples),
+            'one_row_ms': _timed_run([sys.executable, script] + job_args, samples),
+            'heavy_modules_on_import': _heavy_modules('import diploma_generator'),
+            'heavy_modules_on_job': _heavy_modules(job_code)
+        }
+    return resultado
+
+
+def git_revision():
+    """Commit actual del repositorio, para comparar resultados entre commits"""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def run_benchmark(rows=(1, 100), resolutions=('a4-150',), workers=1, pdf_mode='raster', save_png=True,
+                  zip_output=False, stage_samples=50, seed=0, pipeline=False, startup_samples=5):
+    """
+    Ejecuta la batería completa y devuelve los resultados como diccionario
+
+    Args:
+        rows (iterable): Tamaños de roster a generar de punta a punta
+        resolutions (iterable): Claves de RESOLUTIONS para las plantillas
+        workers (int): Procesos en paralelo de generate_diplomas
+        pdf_mode (str): 'raster' o 'vector'
+        save_png (bool): Guardar también los PNG
+        zip_output (bool): Escribir además el ZIP durante la generación
+        stage_samples (int): Filas usadas para medir cada etapa (0 = no medir)
+        seed (int): Semilla de los datos sintéticos
+        pipeline (bool): Generar por etapas con colas acotadas
+        startup_samples (int): Arranques en frío medidos (0 = no medir)
+
+    Returns:
+        dict: Resultados serializables a JSON
+    """
+    resultados = {
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'end_to_end': [],
+        'stages': {}
+    }
+
+    if startup_samples:
+        print(f"Arranque en frío: {startup_samples} muestras", file=sys.stderr)
+        resultados['startup'] = bench_startup(startup_samples, seed)
+        startup = resultados['startup']
+        print(f"  import {startup['import_ms']} ms, --help {startup['help_ms']} ms, "
+              f"1 fila {startup['one_row_ms']} ms (Python solo: {startup['python_ms']} ms)", file=sys.stderr)
+        inesperados = [m for m in startup['heavy_modules_on_job'] if m not in JOB_MODULES]
+        if inesperados:
+            print(f"  Aviso: el trabajo de una fila carga {', '.join(inesperados)}", file=sys.stderr)
+        if startup['heavy_modules_on_import']:
+            print(f"  Aviso: importar el generador carga {', '.join(startup['heavy_modules_on_import'])}",
+                  file=sys.stderr)
+
+    for resolution in resolutions:
+        size = RESOLUTIONS[resolution]
+        if stage_samples:
+            print(f"Etapas: {resolution}, {stage_samples} filas", file=sys.stderr)
+            resultados['stages'][resolution] = bench_stages(size, stage_samples, seed)
+
+        for n in rows:
+            case = {'rows': n, 'resolution': resolution, 'size': size, 'workers': workers,
+                    'pdf_mode': pdf_mode, 'save_png': save_png, 'zip': zip_output, 'seed': seed,
+                    'pipeline': pipeline}
+            print(f"Punta a punta: {resolution}, {n} filas", file=sys.stderr)
+            # Un proceso nuevo por caso: la memoria máxima no arrastra la de casos anteriores
+            with ProcessPoolExecutor(max_workers=1) as executor:
+                resultado = executor.submit(bench_end_to_end, case).result()
+            print(f"  {resultado['rows_per_sec']} filas/s, p95 {resultado['latency']['p95_ms']} ms, "
+                  f"{resultado['peak_rss_mb']} MB", file=sys.stderr)
+            resultados['end_to_end'].append(resultado)
+
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark del generador de diplomas')
+    parser.add_argument('--rows', default='1,100',
+                        help=f"Tamaños de roster separados por comas (predefinidos: {','.join(map(str, ROSTER_SIZES))})")
+    parser.add_argument('--resolutions', default='a4-150',
+                        help=f"Resoluciones de plantilla separadas por comas ({', '.join(RESOLUTIONS)})")
+    parser.add_argument('--workers', type=int, default=1, help='Número de procesos en paralelo')
+    parser.add_argument('--pdf-vectorial', action='store_true', help='Usar el modo de PDF con texto vectorial')
+    parser.add_argument('--solo-pdf', action='store_true', help='No guardar los PNG')
+    parser.add_argument('--zip', action='store_true', help='Escribir también el ZIP durante la generación')
+    parser.add_argument('--por-etapas', action='store_true', help='Generar por etapas con colas acotadas')
+    parser.add_argument('--stage-samples', type=int, default=50, help='Filas para medir cada etapa (0 = omitir)')
+    parser.add_argument('--startup-samples', type=int, default=5,
+                        help='Arranques en frío a medir (0 = omitir)')
+    parser.add_argument('--seed', type=int, default=0, help='Semilla de los datos sintéticos')
+    parser.add_argument('--output', metavar='RUTA', help='Guardar los resultados JSON en este archivo')
+
+    args = parser.parse_args()
+
+    unknown = [r for r in args.resolutions.split(',') if r not in RESOLUTIONS]
+    if unknown:
+        print(f"Error: Resoluciones desconocidas: {', '.join(unknown)}")
+        return
+
+    resultados = run_benchmark(rows=[int(n) for n in args.rows.split(',')],
+                               resolutions=args.resolutions.split(','),
+                               workers=args.workers,
+                               pdf_mode='vector' if args.pdf_vectorial else 'raster',
+                               save_png=not args.solo_pdf,
+                               zip_output=args.zip,
+                               stage_samples=args.stage_samples,
+                               seed=args.seed,
+                               pipeline=args.por_etapas,
+                               startup_samples=args.startup_samples)
+
+    salida = json.dumps(resultados, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(salida)
+        print(f"Resultados guardados en: {args.output}")
+    else:
+        print(salida)
+
+if __name__ == "__main__":
+    main()
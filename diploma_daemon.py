@@ -0,0 +1,361 @@
+"""
+Servicio de generación con procesos "calientes" y una cola en un directorio
+
+Evita pagar el arranque de Python, pandas, reportlab y las fuentes en cada
+lote: los procesos de trabajo se inician una vez y conservan sus
+generadores (fuentes y plantillas decodificadas) entre trabajos.
+
+Estructura del directorio de cola:
+
+    cola/entrada/      Los clientes dejan aquí <id>.json (ver enviar_trabajo)
+    cola/en_proceso/   Trabajos tomados por el servicio
+    cola/terminados/   Manifiestos de trabajos completados
+    cola/fallidos/     Manifiestos de trabajos con error
+    cola/estado/       <id>.json con el estado y progreso de cada trabajo
+    cola/resultados/   Salida por defecto de cada trabajo (<id>/)
+
+Manifiesto de un trabajo:
+
+    {
+        "csv": "datos.csv",                    (o .parquet, .feather, .xlsx)
+        "portada": "portada.png",
+        "contraportada": "contraportada.png",
+        "output": "salida/lote_42",            (opcional)
+        "config": {"fonts": {...}, ...},       (opcional, como get_config())
+        "options": {"save_png": false, "zip_path": "salida/lote_42.zip"}
+    }
+
+Las opciones son los argumentos de generate_diplomas. Las rutas relativas
+se resuelven respecto al directorio del manifiesto.
+"""
+import argparse
+import json
+import logging
+import os
+import signal
+import sys
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+
+from diploma_generator import DiplomaGenerator
+
+logger = logging.getLogger('diploma_generator.daemon')
+
+SUBDIRS = ('entrada', 'en_proceso', 'terminados', 'fallidos', 'estado', 'resultados')
+
+# Opciones de generate_diplomas que se aceptan en un manifiesto
+OPTIONS = ('workers', 'save_png', 'merged_pdf', 'pdf_mode', 'zip_path', 'write_files', 'incremental',
+           'pipeline', 'shard')
+
+
+def _write_json_atomic(path, data):
+    """Escribe un JSON completo o nada: archivo temporal y os.replace"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, path)
+
+
+def preparar_cola(spool):
+    """Crea los subdirectorios de la cola"""
+    for name in SUBDIRS:
+        os.makedirs(os.path.join(spool, name), exist_ok=True)
+
+
+def enviar_trabajo(spool, manifest, job_id=None):
+    """
+    Encola un trabajo de forma atómica (el servicio nunca ve un manifiesto a medias)
+
+    Args:
+        spool (str): Directorio de la cola
+        manifest (dict): Manifiesto del trabajo
+        job_id (str): Id del trabajo; si no se indica se genera uno
+
+    Returns:
+        str: Id del trabajo (su estado estará en cola/estado/<id>.json)
+    """
+    preparar_cola(spool)
+    job_id = job_id or uuid.uuid4().hex[:12]
+    _write_json_atomic(os.path.join(spool, 'entrada', f"{job_id}.json"), manifest)
+    return job_id
+
+
+# ============================================================
+# PROCESOS DE TRABAJO
+# ============================================================
+
+# Generadores calientes del proceso, por par de plantillas
+_generators = {}
+
+
+def _warm_generator(portada, contraportada, output_dir, config):
+    """
+    Devuelve el generador del proceso para esas plantillas, configurado para
+    el trabajo
+
+    Parte siempre de la configuración por defecto, de modo que lo que cambió
+    un trabajo anterior no se arrastra al siguiente.
+
+    Args:
+        config (dict): Cambios con la forma de get_config() (fonts,
+            portada_coords, contraportada_coords, modules, output); todo es
+            opcional, y generate_diplomas toma los módulos de las columnas del CSV
+    """
+    key = (os.path.abspath(portada), os.path.abspath(contraportada))
+    if key not in _generators:
+        generator = DiplomaGenerator(portada, contraportada, output_dir)
+        _generators[key] = (generator, generator.get_config())
+    generator, defaults = _generators[key]
+
+    generator.output_dir = output_dir
+    os.makedirs(f"{output_dir}/png", exist_ok=True)
+    os.makedirs(f"{output_dir}/pdf", exist_ok=True)
+
+    for element, font_config in defaults['fonts'].items():
+        font_config = dict(font_config, **config.get('fonts', {}).get(element, {}))
+        font_config['color'] = tuple(font_config['color'])
+        generator.set_font_config(element, **font_config)
+    generator.set_portada_coordinates(**dict(defaults['portada_coords'], **config.get('portada_coords', {})))
+    generator.set_contraportada_coordinates(**dict(defaults['contraportada_coords'],
+                                                   **config.get('contraportada_coords', {})))
+    generator.set_output_config(**dict(defaults['output'], **config.get('output', {})))
+    generator.module_count = config.get('modules', defaults['modules'])
+    return generator
+
+
+def _init_process(log_level):
+    logging.basicConfig(level=log_level, format='%(message)s', stream=sys.stdout)
+    # Ctrl+C lo gestiona el proceso principal, que deja terminar los trabajos en curso
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def ejecutar_trabajo(job_id, manifest_path, spool):
+    """
+    Ejecuta un trabajo en el proceso de trabajo, escribiendo su estado en
+    cola/estado/<id>.json (como mucho una vez por segundo durante la generación)
+
+    Returns:
+        tuple: (job_id, True si terminó bien)
+    """
+    status_path = os.path.join(spool, 'estado', f"{job_id}.json")
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    estado = {'id': job_id, 'state': 'running', 'pid': os.getpid(), 'started': time.time(),
+              'completed': 0, 'total': None, 'errors': []}
+    _write_json_atomic(status_path, estado)
+
+    def ruta(path):
+        return path if path is None or os.path.isabs(path) else os.path.join(base_dir, path)
+
+    try:
+        with open(manifest_path, encoding='utf-8') as f:
+            manifest = json.load(f)
+
+        output_dir = ruta(manifest.get('output')) or os.path.join(spool, 'resultados', job_id)
+        generator = _warm_generator(ruta(manifest['portada']), ruta(manifest['contraportada']),
+                                    output_dir, manifest.get('config', {}))
+
+        options = {key: value for key, value in manifest.get('options', {}).items() if key in OPTIONS}
+        for key in ('merged_pdf', 'zip_path'):
+            if key in options:
+                options[key] = ruta(options[key])
+
+        ultimo = [0.0]
+
+        def progreso(completados, total, nombre, error):
+            estado['completed'] = completados
+            estado['total'] = total
+            if error is not None:
+                estado['errors'].append({'nombre': nombre, 'error': str(error)})
+            ahora = time.time()
+            if ahora - ultimo[0] >= 1.0 or completados == total:
+                ultimo[0] = ahora
+                _write_json_atomic(status_path, estado)
+
+        generados = generator.generate_diplomas(ruta(manifest['csv']), progress_callback=progreso, **options)
+        if generados is None:
+            raise ValueError("No se pudo leer el CSV o faltan columnas")
+
+        estado.update(state='done', generated=generados, output=output_dir, metrics=generator.metrics.summary())
+        return job_id, True
+    except Exception as e:
+        estado.update(state='failed', error=f"{type(e).__name__}: {e}")
+        logger.exception(f"Trabajo {job_id} fallido")
+        return job_id, False
+    finally:
+        estado['finished'] = time.time()
+        _write_json_atomic(status_path, estado)
+
+
+# ============================================================
+# SERVICIO
+# ============================================================
+
+class SpoolDaemon:
+    """
+    Vigila cola/entrada y reparte los trabajos entre procesos calientes
+
+    Args:
+        spool (str): Directorio de la cola
+        concurrency (int): Trabajos simultáneos (un proceso por trabajo)
+        interval (float): Segundos entre revisiones de la cola
+    """
+
+    def __init__(self, spool, concurrency=2, interval=1.0):
+        self.spool = os.path.abspath(spool)
+        self.concurrency = concurrency
+        self.interval = interval
+        self._stopping = False
+        preparar_cola(self.spool)
+
+    def _dir(self, name):
+        return os.path.join(self.spool, name)
+
+    def recover(self):
+        """Devuelve a la entrada los trabajos que quedaron a medias (servicio interrumpido)"""
+        for name in os.listdir(self._dir('en_proceso')):
+            if name.endswith('.json'):
+                os.replace(os.path.join(self._dir('en_proceso'), name), os.path.join(self._dir('entrada'), name))
+                logger.warning(f"Trabajo recuperado: {name[:-5]}")
+
+    def _pending(self):
+        """Manifiestos en la entrada, del más antiguo al más nuevo"""
+        entrada = self._dir('entrada')
+        names = [name for name in os.listdir(entrada) if name.endswith('.json')]
+        return sorted(names, key=lambda name: os.path.getmtime(os.path.join(entrada, name)))
+
+    def _claim(self, name):
+        """Toma un manifiesto moviéndolo a en_proceso; os.replace es atómico"""
+        source = os.path.join(self._dir('entrada'), name)
+        target = os.path.join(self._dir('en_proceso'), name)
+        try:
+            os.replace(source, target)
+        except FileNotFoundError:
+            return None
+        job_id = name[:-5]
+        _write_json_atomic(os.path.join(self._dir('estado'), f"{job_id}.json"),
+                           {'id': job_id, 'state': 'queued', 'queued': time.time()})
+        return job_id, target
+
+    def _requeue(self, job_id, manifest_path):
+        """Devuelve a la entrada un trabajo tomado que no llegó a empezar"""
+        os.replace(manifest_path, os.path.join(self._dir('entrada'), os.path.basename(manifest_path)))
+        logger.warning(f"Trabajo devuelto a la cola: {job_id}")
+
+    def _state(self, job_id):
+        """Estado escrito en cola/estado/<id>.json, o None si no se puede leer"""
+        try:
+            with open(os.path.join(self._dir('estado'), f"{job_id}.json"), encoding='utf-8') as f:
+                return json.load(f).get('state')
+        except (OSError, ValueError):
+            return None
+
+    def _finish(self, future, job_id, manifest_path):
+        """
+        Mueve el manifiesto de un trabajo terminado a terminados o fallidos.
+        Si el grupo de procesos se rompió (un proceso murió), el trabajo que
+        ya había empezado se da por fallido y el que no, vuelve a la entrada.
+
+        Returns:
+            bool: True si el grupo de procesos está roto
+        """
+        roto = False
+        try:
+            ok = future.result()[1]
+        except Exception as e:
+            roto = isinstance(e, BrokenProcessPool)
+            if roto and self._state(job_id) == 'queued':
+                self._requeue(job_id, manifest_path)
+                return roto
+            # El proceso murió sin poder escribir su estado
+            ok = False
+            _write_json_atomic(os.path.join(self._dir('estado'), f"{job_id}.json"),
+                               {'id': job_id, 'state': 'failed', 'error': f"{type(e).__name__}: {e}",
+                                'finished': time.time()})
+        destino = 'terminados' if ok else 'fallidos'
+        os.replace(manifest_path, os.path.join(self._dir(destino), os.path.basename(manifest_path)))
+        logger.info(f"Trabajo {'completado' if ok else 'fallido'}: {job_id}")
+        return roto
+
+    def _new_executor(self):
+        return ProcessPoolExecutor(max_workers=self.concurrency, initializer=_init_process,
+                                   initargs=(logger.getEffectiveLevel(),))
+
+    def _restart(self, executor, en_curso):
+        """
+        Cierra un grupo de procesos roto tras resolver todos sus trabajos
+        (ver _finish) y devuelve uno nuevo
+        """
+        wait(en_curso)
+        for future in list(en_curso):
+            self._finish(future, *en_curso.pop(future))
+        executor.shutdown(wait=True)
+        logger.warning("Un proceso de trabajo terminó de forma abrupta; se reinician los procesos")
+        return self._new_executor()
+
+    def stop(self, *args):
+        """Deja de tomar trabajos; los que están en curso terminan"""
+        if not self._stopping:
+            logger.info("Deteniendo: se terminan los trabajos en curso...")
+        self._stopping = True
+
+    def serve(self):
+        """Bucle principal del servicio"""
+        self.recover()
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        logger.info(f"Vigilando {self._dir('entrada')} con {self.concurrency} procesos")
+
+        executor = self._new_executor()
+        en_curso = {}
+        try:
+            while not self._stopping or en_curso:
+                if not self._stopping:
+                    for name in self._pending()[:self.concurrency - len(en_curso)]:
+                        claimed = self._claim(name)
+                        if claimed is None:
+                            continue
+                        job_id, manifest_path = claimed
+                        logger.info(f"Trabajo recibido: {job_id}")
+                        try:
+                            future = executor.submit(ejecutar_trabajo, job_id, manifest_path, self.spool)
+                        except BrokenProcessPool:
+                            self._requeue(job_id, manifest_path)
+                            executor = self._restart(executor, en_curso)
+                            break
+                        en_curso[future] = (job_id, manifest_path)
+
+                if not en_curso:
+                    time.sleep(self.interval)
+                    continue
+
+                terminados, _ = wait(en_curso, timeout=self.interval, return_when=FIRST_COMPLETED)
+                roto = False
+                for future in terminados:
+                    roto = self._finish(future, *en_curso.pop(future)) or roto
+                if roto:
+                    executor = self._restart(executor, en_curso)
+        finally:
+            executor.shutdown(wait=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Servicio de generación de diplomas con cola en directorio')
+    parser.add_argument('--cola', default='cola_diplomas', help='Directorio de la cola de trabajos')
+    parser.add_argument('--concurrencia', type=int, default=2, help='Trabajos simultáneos')
+    parser.add_argument('--intervalo', type=float, default=1.0, help='Segundos entre revisiones de la cola')
+    parser.add_argument('--log-level', default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
+                        help='Nivel de detalle de los avisos en consola')
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=args.log_level, format='%(message)s', stream=sys.stdout)
+
+    if args.concurrencia < 1:
+        print("Error: --concurrencia debe ser al menos 1")
+        return
+
+    SpoolDaemon(args.cola, concurrency=args.concurrencia, interval=args.intervalo).serve()
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,1068 @@
-import pandas as pd
 from PIL import Image, ImageDraw, ImageFont
 import os
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter, A4
 import argparse
+import logging
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
+import csv
+import hashlib
+import io
+import json
 import math
+import mmap
+import queue
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+
+# Datos ya preprocesados de un estudiante, listos para dibujar
+Registro = namedtuple('Registro', ['nombre', 'folio', 'safe_name', 'calificaciones', 'promedio'])
+
+def _check_record(registro):
+    """Devuelve el nombre del registro o lanza un error si no es un texto válido"""
+    if registro.safe_name is None:
+        raise ValueError(f"Nombre no válido: {registro.nombre!r}")
+    return registro.nombre
+
+def _record_name(registro):
+    """Nombre del registro para los mensajes de error"""
+    return registro.nombre if isinstance(registro.nombre, str) else 'desconocido'
+
+# Avisos del generador; main() los muestra en consola con basicConfig
+logger = logging.getLogger('diploma_generator')
+
+# Salidas de cada estudiante
+PAGES = ('portada', 'contraportada', 'pdf')
+
+# Extensión de archivo de cada formato de imagen de salida
+IMAGE_EXTENSIONS = {'png': 'png', 'jpeg': 'jpg', 'webp': 'webp'}
+
+# Resumen de un fragmento (--shard) en su directorio de salida
+SHARD_FILE = 'shard.json'
+
+# Columnas de calificación; el número de módulos es el mayor N presente
+MODULE_COLUMN_RE = re.compile(r'modulo([1-9]\d*)_calificacion')
+
+# Módulos cuando los datos no tienen columnas moduloN_calificacion
+DEFAULT_MODULES = 4
+
+# Horas de cada módulo; el total de la contraportada es HORAS_POR_MODULO × módulos
+HORAS_POR_MODULO = 30
+
+# pandas y reportlab se importan dentro de las funciones que los usan: --help,
+# la validación de argumentos y los CSV pequeños no pagan su carga.
+
+# Tamaño máximo de un CSV que se lee con el módulo csv en lugar de pandas
+CSV_STDLIB_MAX_BYTES = 1 << 20
+
+# Formatos de los datos por extensión; cualquier otra extensión se lee como CSV
+INPUT_FORMATS = {
+    '.csv': 'csv',
+    '.parquet': 'parquet',
+    '.pq': 'parquet',
+    '.feather': 'feather',
+    '.arrow': 'feather',
+    '.xlsx': 'xlsx'
+}
+
+# Dependencia opcional que necesita cada formato además de pandas
+INPUT_PACKAGES = {'parquet': 'pyarrow', 'feather': 'pyarrow', 'xlsx': 'openpyxl'}
+
+
+class CsvTable:
+    """
+    Columnas de un CSV leídas con el módulo csv, con los mismos tipos que
+    daría pd.read_csv: enteros, decimales (también los enteros con celdas
+    vacías), textos y celdas vacías como NaN. Solo se guardan las columnas
+    que usa el generador (needed_column). Solo se usa cuando no hay dudas;
+    read() devuelve None si alguna columna necesaria tiene valores que
+    pandas interpretaría de otra forma (NA, booleanos, espacios, inf...).
+    """
+
+    INT_RE = re.compile(r'[+-]?\d+')
+    FLOAT_RE = re.compile(r'[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?')
+    # Valores que pandas convierte en NaN o en booleanos por defecto
+    SPECIAL = {'#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+               '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null',
+               'True', 'TRUE', 'true', 'False', 'FALSE', 'false'}
+
+    def __init__(self, columns, data, rows):
+        self.columns = columns
+        self._data = data
+        self._rows = rows
+
+    def __len__(self):
+        return self._rows
+
+    def __getitem__(self, column):
+        return self._data[column]
+
+    @classmethod
+    def _kind(cls, value):
+        """'na', 'int', 'float', 'str' o None si el valor es dudoso"""
+        if value == '':
+            return 'na'
+        if value in cls.SPECIAL:
+            return None
+        if value.startswith('-') and cls.FLOAT_RE.fullmatch(value) and float(value) == 0:
+            return None  # pandas no siempre conserva el signo de -0
+        if cls.INT_RE.fullmatch(value):
+            return 'int' if -2 ** 63 <= int(value) < 2 ** 63 else None
+        if cls.FLOAT_RE.fullmatch(value):
+            return 'float'
+        try:
+            float(value)  # ' 9', 'inf', '1_0': pandas no los trata igual que float()
+            return None
+        except ValueError:
+            return 'str'
+
+    @classmethod
+    def _convert(cls, values):
+        """Convierte una columna como pandas, o devuelve None si hay dudas"""
+        kinds = set()
+        for value in values:
+            kind = cls._kind(value)
+            if kind is None:
+                return None
+            kinds.add(kind)
+        
+        nan = float('nan')
+        if 'str' in kinds:
+            return [nan if value == '' else value for value in values]
+        if kinds == {'int'}:
+            return [int(value) for value in values]
+        return [nan if value == '' else float(value) for value in values]
+
+    @classmethod
+    def read(cls, path):
+        """Lee el CSV, o devuelve None si hay que leerlo con pandas"""
+        try:
+            with open(path, newline='', encoding='utf-8-sig') as f:
+                reader = csv.reader(f)
+                header = next(reader, None)
+                if not header or len(set(header)) != len(header):
+                    return None
+                indices = [i for i, column in enumerate(header) if needed_column(column)]
+                values = [[] for _ in indices]
+                rows = 0
+                for row in reader:
+                    if not row:
+                        continue
+                    if len(row) != len(header):
+                        return None
+                    for column_values, i in zip(values, indices):
+                        column_values.append(row[i])
+                    rows += 1
+        except (UnicodeDecodeError, csv.Error):
+            return None
+        
+        data = {}
+        for i, column_values in zip(indices, values):
+            data[header[i]] = cls._convert(column_values)
+            if data[header[i]] is None:
+                return None
+        return cls(header, data, rows)
+
+def _write_data(target, data):
+    """Escribe bytes en una ruta o archivo abierto"""
+    if isinstance(target, str):
+        with open(target, 'wb') as f:
+            f.write(data)
+    else:
+        target.write(data)
+
+def _has_alpha(img):
+    """True si la imagen tiene algún píxel no totalmente opaco"""
+    return img.mode in ('RGBA', 'LA', 'PA') and img.getchannel('A').getextrema()[0] < 255
+
+def _hash_data(data):
+    """Huella estable de datos serializables a JSON"""
+    return hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+def _file_hash(path):
+    """Huella del contenido de un archivo"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _write_json(path, data):
+    """Escribe un JSON de forma atómica (archivo temporal y os.replace)"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, path)
+
+def shard_of(folio, count):
+    """
+    Fragmento (de 1 a count) al que pertenece un folio. Depende solo del
+    folio, así que todas las máquinas reparten el mismo CSV igual.
+    """
+    digest = hashlib.sha256(str(folio).encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') % count + 1
+
+def module_count(columns):
+    """
+    Número de módulos según las columnas moduloN_calificacion (el mayor N;
+    los módulos sin columna cuentan con calificación 0)
+    """
+    numeros = [int(match.group(1)) for match in map(MODULE_COLUMN_RE.fullmatch, map(str, columns)) if match]
+    return max(numeros, default=DEFAULT_MODULES)
+
+def needed_column(column):
+    """True si el generador usa la columna (nombre, folio o moduloN_calificacion)"""
+    return column in ('nombre', 'folio') or MODULE_COLUMN_RE.fullmatch(str(column)) is not None
+
+def input_format(path):
+    """Formato de un archivo de datos según su extensión (ver INPUT_FORMATS)"""
+    return INPUT_FORMATS.get(os.path.splitext(str(path))[1].lower(), 'csv')
+
+def read_data(source, formato):
+    """
+    Lee un archivo de datos con pandas, solo con las columnas que usa el
+    generador; el resto no se convierte ni se guarda en memoria. Parquet,
+    Feather/Arrow y XLSX conservan los tipos del archivo. En el CSV pandas
+    infiere los tipos de esas columnas como siempre: forzarlos cambiaría
+    cómo se escriben folios y calificaciones (007 y 7, 9 y 9.0).
+    
+    Args:
+        source (str | file): Ruta o archivo abierto en modo binario
+        formato (str): 'csv', 'parquet', 'feather' o 'xlsx' (ver input_format)
+    
+    Returns:
+        pandas.DataFrame: Columnas nombre, folio y moduloN_calificacion presentes
+    """
+    import pandas as pd
+    
+    if formato == 'csv':
+        return pd.read_csv(source, usecols=needed_column)
+    if formato == 'xlsx':
+        return pd.read_excel(source, usecols=needed_column, engine='openpyxl')
+    if formato == 'parquet':
+        import pyarrow.parquet as pq
+        
+        # Solo se decodifican las columnas elegidas; la tabla proyectada se lee de una vez
+        archivo = pq.ParquetFile(source)
+        columnas = [column for column in archivo.schema_arrow.names if needed_column(column)]
+        return archivo.read(columns=columnas).to_pandas()
+    if formato == 'feather':
+        import pyarrow.ipc
+        
+        # El esquema está en el pie del archivo; no se lee ningún dato
+        if isinstance(source, str):
+            with open(source, 'rb') as f:
+                nombres = pyarrow.ipc.open_file(f).schema.names
+        else:
+            nombres = pyarrow.ipc.open_file(source).schema.names
+            source.seek(0)
+        return pd.read_feather(source, columns=[column for column in nombres if needed_column(column)])
+    raise ValueError(f"Formato de datos no válido: {formato}")
+
+# Fuentes TTF ya registradas en reportlab, por ruta absoluta
+_PDF_FONTS = {}
+
+def _register_pdf_font(path):
+    """
+    Registra una fuente TTF en reportlab (se incrusta como subconjunto) y
+    devuelve su nombre; usa Helvetica si la fuente no se puede incrustar
+    """
+    if not isinstance(path, str):
+        return 'Helvetica'
+    
+    abs_path = os.path.abspath(path)
+    if abs_path not in _PDF_FONTS:
+        from reportlab.pdfbase import pdfmetrics
+        from reportlab.pdfbase.ttfonts import TTFont
+        
+        font_name = f"{os.path.splitext(os.path.basename(abs_path))[0]}-{len(_PDF_FONTS)}"
+        try:
+            pdfmetrics.registerFont(TTFont(font_name, abs_path))
+        except Exception as e:
+            logger.warning(f"Advertencia: No se pudo incrustar la fuente {path} en el PDF, usando Helvetica: {e}")
+            font_name = 'Helvetica'
+        _PDF_FONTS[abs_path] = font_name
+    return _PDF_FONTS[abs_path]
+
+# Versiones mayores de reportlab probadas con el registro manual de XObjects
+# de _draw_pdf_background, que usa internos del Canvas y del documento
+REPORTLAB_XOBJECT_VERSIONS = (3, 4, 5)
+
+# Atributos de PDFImageXObject que bastan para volver a escribir la imagen
+XOBJECT_FIELDS = ('name', 'width', 'height', 'bitsPerComponent', 'colorSpace',
+                  '_filters', 'streamContent', 'mask')
+
+_SHARES_XOBJECTS = None
+
+def _shares_xobjects(c):
+    """
+    Indica si el fondo ya comprimido puede registrarse a mano en el canvas c:
+    reportlab debe ser de una versión probada y exponer los internos que usa
+    _draw_pdf_background; en otro caso se recurre a drawImage
+    """
+    global _SHARES_XOBJECTS
+    if _SHARES_XOBJECTS is None:
+        import reportlab
+
+        try:
+            mayor = int(reportlab.Version.split('.')[0])
+        except (AttributeError, ValueError):
+            mayor = None
+        _SHARES_XOBJECTS = mayor in REPORTLAB_XOBJECT_VERSIONS
+        if not _SHARES_XOBJECTS:
+            logger.debug(f"reportlab {getattr(reportlab, 'Version', '?')}: el fondo de los PDF vectoriales se dibuja con drawImage")
+    return (_SHARES_XOBJECTS
+            and all(hasattr(c, attr) for attr in ('_doc', '_code', '_formsinuse', '_setXObjects'))
+            and all(hasattr(c._doc, attr) for attr in ('getXObjectName', 'idToObject', 'Reference', 'addForm')))
+
+# Lienzo mínimo para medir textos fuera de una página
+_MEASURE_DRAW = None
+
+def _measure_draw():
+    """Devuelve un ImageDraw auxiliar para medir textos con textbbox"""
+    global _MEASURE_DRAW
+    if _MEASURE_DRAW is None:
+        _MEASURE_DRAW = ImageDraw.Draw(Image.new('RGB', (1, 1)))
+    return _MEASURE_DRAW
+
+def _page_transform(size):
+    """
+    Devuelve (x, y, escala) con los que create_pdf coloca una imagen del
+    tamaño dado en la página A4 (centrada y conservando la proporción)
+    """
+    from reportlab.lib.boxstuff import aspectRatioFix
+    from reportlab.lib.pagesizes import A4
+    
+    x, y, _, _, scale = aspectRatioFix(True, 'c', 0, 0, A4[0], A4[1], size[0], size[1])
+    return x, y, scale
+
+
+class TemplateCache:
+    """
+    Caché de plantillas decodificadas
+
+    Cada plantilla se lee, descomprime y convierte al modo final una sola vez;
+    las filas trabajan sobre una copia en memoria. La entrada se invalida sola
+    cuando cambia la ruta o la fecha de modificación del archivo.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _final_mode(img):
+        """Convierte la plantilla a RGB, o a RGBA si tiene transparencia real"""
+        if img.mode in ('RGB', 'RGBA'):
+            return img
+        if img.mode in ('LA', 'PA', 'La') or 'transparency' in img.info:
+            return img.convert('RGBA')
+        return img.convert('RGB')
+
+    def get(self, path):
+        """Devuelve la plantilla decodificada (no modificar, usar canvas())"""
+        abs_path = os.path.abspath(path)
+        stat = os.stat(abs_path)
+        key = (stat.st_mtime_ns, stat.st_size)
+
+        entry = self._entries.get(abs_path)
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry[1]
+
+        self.misses += 1
+        with Image.open(abs_path) as img:
+            img.load()
+            base = self._final_mode(img)
+            if base is img:
+                base = img.copy()
+        self._entries[abs_path] = (key, base)
+        return base
+
+    def canvas(self, path):
+        """Devuelve una copia de trabajo de la plantilla para una fila"""
+        return self.get(path).copy()
+
+    def set(self, path, base):
+        """Guarda una plantilla ya decodificada en otro lugar (ver SharedTemplates)"""
+        abs_path = os.path.abspath(path)
+        stat = os.stat(abs_path)
+        self._entries[abs_path] = ((stat.st_mtime_ns, stat.st_size), base)
+
+    def discard(self, path):
+        """Elimina una plantilla de la caché"""
+        self._entries.pop(os.path.abspath(path), None)
+
+    def clear(self):
+        """Vacía la caché y reinicia los contadores"""
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        """Contadores de aciertos y fallos de la caché"""
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._entries)}
+
+
+def _map_image(buffer, offset, mode, size):
+    """
+    Envuelve píxeles en bruto como imagen sin copiarlos. Es lo que hace
+    Image.frombuffer, pero este solo lo permite en algunos modos y no en RGB;
+    los datos deben tener la disposición interna de Pillow (4 bytes por
+    píxel en RGB y RGBA). La imagen es de solo lectura.
+    """
+    img = Image.new(mode, (0, 0))._new(Image.core.map_buffer(buffer, size, 'raw', offset, (mode, 0, 1)))
+    img.readonly = 1
+    return img
+
+
+class SharedTemplates:
+    """
+    Plantillas decodificadas compartidas entre los procesos de trabajo
+
+    El proceso principal escribe una sola vez los píxeles en bruto en un
+    archivo junto a la salida; cada proceso lo proyecta en memoria (mmap) y
+    envuelve las imágenes sin copiarlas, así que todos usan las mismas
+    páginas de memoria en lugar de decodificar cada uno su copia. Se usa un
+    archivo y no /dev/shm porque en los contenedores suele medir 64 MB.
+
+    Args:
+        directory (str): Directorio donde crear el archivo temporal
+    """
+
+    def __init__(self, directory):
+        fd, self.path = tempfile.mkstemp(prefix='.plantillas_', suffix='.raw', dir=directory)
+        self._file = os.fdopen(fd, 'wb')
+        self.entries = {}
+
+    def add(self, key, img):
+        """Añade una imagen RGB o RGBA con la clave dada"""
+        self.entries[key] = (self._file.tell(), img.mode, img.size)
+        self._file.write(img.tobytes('raw', 'RGBX' if img.mode == 'RGB' else img.mode))
+
+    def descriptor(self):
+        """Cierra el archivo y devuelve lo que necesita attach() en otro proceso"""
+        self._file.close()
+        return {'path': self.path, 'entries': self.entries}
+
+    def remove(self):
+        """Elimina el archivo (los procesos que ya lo proyectaron conservan sus datos)"""
+        self._file.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    @staticmethod
+    def attach(descriptor):
+        """Proyecta el archivo y devuelve {clave: imagen de solo lectura}"""
+        with open(descriptor['path'], 'rb') as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return {key: _map_image(data, offset, mode, tuple(size))
+                for key, (offset, mode, size) in descriptor['entries'].items()}
+
+
+class TextSpriteCache:
+    """
+    Caché LRU de textos ya medidos y rasterizados
+
+    Guarda, por (fuente, tamaño, color, texto), la caja del texto y la máscara
+    de cobertura de sus glifos. Pegar el color con esa máscara es exactamente
+    lo que hace ImageDraw.text, así que los textos repetidos ("30 horas",
+    calificaciones) se pegan en lugar de volver a pasar por FreeType. Los
+    textos distintos en cada fila (ROW_UNIQUE_ELEMENTS) no pasan por aquí.
+    """
+
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, font, color, text, render=True):
+        """
+        Devuelve [bbox, máscara] del texto, o None si la fuente no es TrueType.
+        Con render=False solo se garantiza la medida (la máscara puede ser None).
+        """
+        path = getattr(font, 'path', None)
+        if not isinstance(path, str):
+            return None
+        
+        key = (path, font.size, tuple(color), text)
+        entry = self._entries.get(key)
+        if entry is not None:
+            self.hits += 1
+            self._entries.move_to_end(key)
+        else:
+            self.misses += 1
+            entry = [_measure_draw().textbbox((0, 0), text, font=font), None]
+            self._entries[key] = entry
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        
+        if render and entry[1] is None:
+            left, top, right, bottom = entry[0]
+            if right > left and bottom > top:
+                mask = Image.new('L', (right - left, bottom - top), 0)
+                ImageDraw.Draw(mask).text((-left, -top), text, fill=255, font=font)
+                entry[1] = mask
+        return entry
+
+    def clear(self):
+        """Vacía la caché y reinicia los contadores"""
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def stats(self):
+        """Contadores de la caché y tasa de aciertos"""
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': len(self._entries),
+            'hit_rate': self.hits / total if total else 0.0
+        }
+
+
+class FontRegistry:
+    """
+    Registro de fuentes compartido por todo el proceso
+
+    Cada nombre de fuente se busca una sola vez en las rutas del sistema y
+    cada (ruta, tamaño) se carga una sola vez; los generadores y los procesos
+    de trabajo reutilizan las fuentes ya cargadas. Una entrada se vuelve a
+    cargar si el archivo de la fuente cambió en disco.
+    """
+
+    SEARCH_PATHS = (
+        "/System/Library/Fonts/{}",
+        "/usr/share/fonts/truetype/dejavu/{}",
+        "C:/Windows/Fonts/{}",
+        "{}"
+    )
+
+    def __init__(self):
+        self._paths = {}
+        self._fonts = {}
+        self.hits = 0
+        self.loads = 0
+        self.load_time = 0.0
+
+    @staticmethod
+    def _signature(path):
+        """(fecha de modificación, tamaño) del archivo, o None si no existe en disco"""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _load(self, font_name, size):
+        """Busca la fuente en las rutas del sistema; devuelve (ruta, fuente)"""
+        for pattern in self.SEARCH_PATHS:
+            path = pattern.format(font_name)
+            try:
+                return path, ImageFont.truetype(path, size)
+            except Exception:
+                continue
+        return None, None
+
+    def get(self, font_name, size):
+        """Devuelve la fuente cargada, o la fuente por defecto si no se encuentra"""
+        path = self._paths.get(font_name)
+        if path is not None:
+            key = (os.path.abspath(path), size)
+            entry = self._fonts.get(key)
+            if entry is not None and entry[0] == self._signature(path):
+                self.hits += 1
+                return entry[1]
+            start = time.perf_counter()
+            try:
+                font = ImageFont.truetype(path, size)
+            except Exception:
+                font = None
+        else:
+            start = time.perf_counter()
+            path, font = self._load(font_name, size)
+        
+        if font is None:
+            self._paths.pop(font_name, None)
+            logger.warning(f"Advertencia: No se pudo cargar la fuente {font_name}, usando fuente por defecto")
+            return ImageFont.load_default()
+        
+        self.loads += 1
+        self.load_time += time.perf_counter() - start
+        self._paths[font_name] = path
+        self._fonts[(os.path.abspath(path), size)] = (self._signature(path), font)
+        return font
+
+    def clear(self):
+        """Vacía el registro y reinicia los contadores"""
+        self._paths.clear()
+        self._fonts.clear()
+        self.hits = 0
+        self.loads = 0
+        self.load_time = 0.0
+
+    def stats(self):
+        """Fuentes cargadas, reutilizaciones y tiempo total de carga"""
+        return {
+            'hits': self.hits,
+            'loads': self.loads,
+            'entries': len(self._fonts),
+            'load_time': self.load_time
+        }
+
+
+# Registro de fuentes del proceso
+FONT_REGISTRY = FontRegistry()
+
+
+# Elementos con un texto distinto en cada fila: se miden y dibujan sin
+# TextSpriteCache, donde solo ocuparían memoria y desplazarían a los repetidos
+ROW_UNIQUE_ELEMENTS = ('nombre', 'folio')
+
+
+class TextStyle:
+    """Fuente ya cargada y color de un elemento de texto del layout"""
+
+    __slots__ = ('element', 'font', 'color', 'pdf_color', 'size', 'cached')
+
+    def __init__(self, element, font, color, size):
+        self.element = element
+        self.font = font
+        # Sus textos se repiten entre filas y se guardan en TextSpriteCache
+        self.cached = element not in ROW_UNIQUE_ELEMENTS
+        self.color = tuple(color)
+        # Color del PDF, de 0 a 1
+        self.pdf_color = tuple(channel / 255 for channel in self.color[:3])
+        # Tamaño real de la fuente (la fuente por defecto de PIL no tiene)
+        self.size = getattr(font, 'size', size)
+
+
+class LayoutPlan:
+    """
+    Fuentes, colores y coordenadas de las dos páginas compilados una sola
+    vez para un número de módulos. El bucle por fila solo recorre sus
+    elementos (estilo, x, y); no se busca nada por nombre. No se modifica:
+    los métodos set_* del generador descartan los planes compilados.
+
+    Todos los textos se centran horizontalmente respecto a x y su parte
+    superior queda en y. En la portada, x o y en None se calculan con el
+    tamaño de la plantilla.
+
+    Args:
+        fonts (dict): Fuente cargada de cada elemento
+        configs (dict): Configuración de cada elemento, como get_font_configs()
+        portada_coords (dict): Coordenadas de la portada
+        contraportada_coords (dict): Coordenadas de la contraportada
+        modulos (int): Número de módulos de la contraportada
+    """
+
+    __slots__ = ('modulos', 'nombre', 'folio', 'calificaciones', 'promedio_final', 'static_layout')
+
+    def __init__(self, fonts, configs, portada_coords, contraportada_coords, modulos):
+        styles = {element: TextStyle(element, fonts[element], config['color'], config['size'])
+                  for element, config in configs.items()}
+        coords = contraportada_coords
+        
+        self.modulos = modulos
+        self.nombre = (styles['nombre'], portada_coords['nombre_x'], portada_coords['nombre_y'])
+        self.folio = (styles['folio'], portada_coords['folio_x'], portada_coords['folio_y'])
+        self.calificaciones = tuple(
+            (styles['modulos'], coords['calif_base_x'], coords['calif_base_y'] + coords['incremento_y'] * i)
+            for i in range(modulos)
+        )
+        self.promedio_final = (styles['promedio_final'], coords['promedio_x'], coords['promedio_y'])
+        
+        # Las horas de cada módulo y el total no dependen de la fila
+        self.static_layout = tuple(
+            (styles['modulos'], f"{HORAS_POR_MODULO} horas",
+             coords['mod_base_x'], coords['mod_base_y'] + coords['incremento_y'] * i)
+            for i in range(modulos)
+        ) + ((styles['total_horas'], f"{HORAS_POR_MODULO * modulos} horas", coords['total_x'], coords['total_y']),)
+
+    def portada_layout(self, nombre, folio, size):
+        """Textos de la portada: tuplas (TextStyle, texto, x, y)"""
+        width, height = size
+        nombre_style, nombre_x, nombre_y = self.nombre
+        folio_style, folio_x, folio_y = self.folio
+        return [
+            (nombre_style, nombre, width // 2 if nombre_x is None else nombre_x,
+             height // 2 - 295 if nombre_y is None else nombre_y),
+            (folio_style, f"Folio: {folio}", width // 2 if folio_x is None else folio_x,
+             height // 2 - 150 if folio_y is None else folio_y)
+        ]
+
+    def row_layout(self, registro):
+        """Calificaciones y promedio de un Registro: tuplas (TextStyle, texto, x, y)"""
+        layout = [(style, texto, x, y) for (style, x, y), texto in zip(self.calificaciones, registro.calificaciones)]
+        style, x, y = self.promedio_final
+        layout.append((style, f"Promedio Final: {registro.promedio}", x, y))
+        return layout
+
+
+class Manifest:
+    """
+    Manifiesto del directorio de salida: huella de cada página generada y
+    archivos de cada estudiante. Cada fila terminada se añade a un diario
+    (una línea JSON) para poder reanudar tras una interrupción; al terminar
+    se escribe manifest.json de forma atómica y se borra el diario.
+    """
+
+    FILENAME = 'manifest.json'
+    JOURNAL = 'manifest.journal'
+
+    def __init__(self, output_dir):
+        self.path = os.path.join(output_dir, self.FILENAME)
+        self.journal_path = os.path.join(output_dir, self.JOURNAL)
+        self._entries = {}
+        
+        if os.path.exists(self.path):
+            with open(self.path, encoding='utf-8') as f:
+                self._entries = json.load(f).get('entries', {})
+        
+        # Filas terminadas en una ejecución interrumpida
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        change = json.loads(line)
+                    except ValueError:
+                        continue  # última línea a medio escribir
+                    if change.get('removed'):
+                        self._entries.pop(change['key'], None)
+                    else:
+                        self._entries[change['key']] = change['entry']
+        
+        self._journal = open(self.journal_path, 'a', encoding='utf-8')
+
+    def keys(self):
+        return list(self._entries)
+
+    def get(self, key):
+        return self._entries.get(key)
+
+    def _log(self, change):
+        self._journal.write(json.dumps(change, ensure_ascii=False) + '\n')
+        self._journal.flush()
+
+    def record(self, key, entry):
+        """Guarda la entrada de un estudiante"""
+        self._entries[key] = entry
+        self._log({'key': key, 'entry': entry})
+
+    def remove(self, key):
+        """Elimina la entrada de un estudiante"""
+        self._entries.pop(key, None)
+        self._log({'key': key, 'removed': True})
+
+    def save(self):
+        """Escribe el manifiesto completo y descarta el diario"""
+        _write_json(self.path, {'version': 1, 'entries': self._entries})
+        self._journal.close()
+        os.remove(self.journal_path)
+
+
+class ArchiveWriter:
+    """
+    ZIP que recibe cada diploma en cuanto se genera. PNG y PDF ya están
+    comprimidos, así que por defecto se guardan sin recomprimir (STORED).
+    """
+
+    def __init__(self, path, compression=zipfile.ZIP_STORED):
+        self.path = path
+        self._zip = zipfile.ZipFile(path, 'w', compression)
+
+    def write(self, arcname, data):
+        """Añade un archivo al ZIP a partir de sus bytes"""
+        self._zip.writestr(arcname, data)
+
+    def write_file(self, path, arcname):
+        """Añade al ZIP un archivo que ya existe en disco"""
+        self._zip.write(path, arcname)
+
+    def close(self):
+        self._zip.close()
+
+
+class ArchiveFiles:
+    """
+    Entradas del ZIP de un proceso de trabajo: los archivos quedan en disco
+    y al proceso principal solo se le devuelve su ruta relativa, que añade
+    con ArchiveWriter.write_file. Así la memoria no crece con el bloque.
+    
+    Args:
+        directory (str): Donde escribir cada entrada; None si el archivo
+            suelto ya se escribe en el directorio de salida (write_files)
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory
+        self._entries = []
+
+    def write(self, arcname, data):
+        if self.directory is not None:
+            _write_data(os.path.join(self.directory, arcname), data)
+        self._entries.append(arcname)
+
+    def drain(self):
+        """Devuelve las rutas relativas acumuladas y vacía la lista"""
+        entries, self._entries = self._entries, []
+        return entries
+
+
+class Metrics:
+    """
+    Métricas de una generación: duración de cada etapa ('template',
+    'text_layout', 'image_encode', 'pdf_write', 'zip_write', 'file_write'),
+    bytes escritos por tipo de archivo y filas terminadas. Cada oyente recibe
+    los eventos ({'type': 'stage' | 'row', ...}) en cuanto se producen.
+    """
+
+    def __init__(self, listeners=None):
+        self.listeners = list(listeners or [])
+        self.reset()
+
+    def reset(self):
+        """Reinicia los contadores (los oyentes se conservan)"""
+        self.timings = {}
+        self.bytes_written = {}
+        self.rows_ok = 0
+        self.rows_failed = 0
+        self.pipeline = None
+        self.started = time.perf_counter()
+        self.finished = None
+
+    def finish(self):
+        """Marca el final de la generación"""
+        self.finished = time.perf_counter()
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def _emit(self, event):
+        for listener in self.listeners:
+            listener(event)
+
+    @contextmanager
+    def stage(self, name):
+        """Mide la duración del bloque como una etapa"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_stage(name, time.perf_counter() - start)
+
+    def record_stage(self, name, seconds):
+        self.timings.setdefault(name, []).append(seconds)
+        if self.listeners:
+            self._emit({'type': 'stage', 'stage': name, 'seconds': seconds})
+
+    def record_bytes(self, kind, count):
+        self.bytes_written[kind] = self.bytes_written.get(kind, 0) + count
+
+    def record_row(self, nombre, error=None):
+        """Registra una fila terminada, con o sin error"""
+        if error is None:
+            self.rows_ok += 1
+        else:
+            self.rows_failed += 1
+        if self.listeners:
+            self._emit({'type': 'row', 'nombre': nombre, 'error': error, 'ok': self.rows_ok,
+                        'failed': self.rows_failed, 'elapsed': time.perf_counter() - self.started})
+
+    def drain(self):
+        """Devuelve las duraciones y bytes acumulados y los vacía (procesos de trabajo)"""
+        data = {'timings': self.timings, 'bytes': self.bytes_written}
+        self.timings = {}
+        self.bytes_written = {}
+        return data
+
+    def merge(self, data):
+        """Suma las métricas devueltas por drain() en otro proceso"""
+        for name, values in data['timings'].items():
+            self.timings.setdefault(name, []).extend(values)
+        for kind, count in data['bytes'].items():
+            self.record_bytes(kind, count)
+
+    @staticmethod
+    def _percentile(values, q):
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+    def summary(self):
+        """Resumen serializable a JSON: etapas (ms), bytes, filas y filas por segundo"""
+        elapsed = (self.finished or time.perf_counter()) - self.started
+        rows = self.rows_ok + self.rows_failed
+        return {
+            'seconds': round(elapsed, 3),
+            'rows': {'ok': self.rows_ok, 'failed': self.rows_failed},
+            'rows_per_sec': round(rows / elapsed, 2) if elapsed else None,
+            'stages': {
+                name: {
+                    'count': len(values),
+                    'total_ms': round(sum(values) * 1000, 3),
+                    'p50_ms': round(self._percentile(values, 0.5) * 1000, 3),
+                    'p95_ms': round(self._percentile(values, 0.95) * 1000, 3)
+                }
+                for name, values in self.timings.items()
+            },
+            'bytes': dict(self.bytes_written),
+            'pipeline': self.pipeline
+        }
+
+
+# Marca de fin de las colas de Pipeline
+_END = object()
+
+
+class Pipeline:
+    """
+    Etapas conectadas por colas acotadas, cada una con su propio pool de hilos
+
+    Cada etapa toma los elementos en orden, los envía a su pool y deja el
+    futuro en la cola siguiente; cuando una cola se llena, la etapa que la
+    alimenta espera. Así nunca hay más de unos pocos elementos en vuelo
+    (la memoria no crece con el número de filas) y el trabajo que suelta el
+    GIL (zlib, escritura de archivos) de una fila se solapa con el
+    renderizado de las siguientes. El orden de salida es el de entrada.
+
+    Args:
+        stages (list): Tuplas (nombre, función, hilos); la función recibe el
+            elemento y lo modifica. Si lanza una excepción, el elemento pasa
+            por el resto de etapas sin procesarse y sale con ese error.
+        depth (int): Capacidad de cada cola
+    """
+
+    def __init__(self, stages, depth=2):
+        self.stages = stages
+        self.depth = depth
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._busy = {name: 0.0 for name, _, _ in stages}
+        self._depths = {name: [0, 0, 0] for name, _, _ in stages}  # suma, muestras, máximo
+        self._started = None
+        self._finished = None
+
+    def _put(self, q, entry):
+        while not self._stop.is_set():
+            try:
+                q.put(entry, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _get(self, q):
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _END
+
+    @staticmethod
+    def _resolve(entry):
+        """(elemento, error) de una entrada de cola: futuro o par ya resuelto"""
+        return entry.result() if isinstance(entry, Future) else entry
+
+    def _call(self, name, fn, item):
+        start = time.perf_counter()
+        try:
+            fn(item)
+            return item, None
+        except Exception as e:
+            return item, e
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self._busy[name] += elapsed
+
+    def _feed(self, items, q):
+        for item in items:
+            if self._stop.is_set():
+                return
+            self._put(q, (item, None))
+        self._put(q, _END)
+
+    def _run_stage(self, name, fn, pool, source, target):
+        depth = self._depths[name]
+        while True:
+            entry = self._get(source)
+            if entry is _END:
+                self._put(target, _END)
+                return
+            size = source.qsize() + 1
+            depth[0] += size
+            depth[1] += 1
+            depth[2] = max(depth[2], size)
+
+            item, error = self._resolve(entry)
+            if error is None:
+                entry = pool.submit(self._call, name, fn, item)
+            self._put(target, entry)
+
+    def run(self, items):
+        """
+        Procesa los elementos y los devuelve en orden como (elemento, error).
+        Si se deja de consumir el generador, las etapas se detienen tras los
+        elementos en curso.
+        """
+        queues = [queue.Queue(maxsize=self.depth) for _ in range(len(self.stages) + 1)]
+        pools = [ThreadPoolExecutor(max_workers=threads, thread_name_prefix=f"etapa-{name}")
+                 for name, _, threads in self.stages]
+        threads = [threading.Thread(target=self._feed, args=(items, queues[0]), daemon=True)]
+        for i, (name, fn, _) in enumerate(self.stages):
+            threads.append(threading.Thread(target=self._run_stage, daemon=True,
+                                            args=(name, fn, pools[i], queues[i], queues[i + 1])))
+
+        self._started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        try:
+            while True:
+                entry = self._get(queues[-1])
+                if entry is _END:
+                    break
+                yield self._resolve(entry)
+        finally:
+            self._finished = time.perf_counter()
+            self._stop.set()
+            for thread in threads:
+                thread.join()
+            for pool in pools:
+                pool.shutdown(wait=True, cancel_futures=True)
+
+    def stats(self):
+        """
+        Por etapa: hilos, tiempo ocupado, utilización (tiempo ocupado entre
+        tiempo disponible de sus hilos) y profundidad media y máxima de su
+        cola de entrada
+        """
+        elapsed = ((self._finished or time.perf_counter()) - self._started) if self._started else 0.0
+        stats = {}
+        for name, _, threads in self.stages:
+            total, samples, maximum = self._depths[name]
+            busy = self._busy[name]
+            stats[name] = {
+                'threads': threads,
+                'busy_s': round(busy, 3),
+                'utilization': round(busy / (elapsed * threads), 3) if elapsed else 0.0,
+                'queue_mean': round(total / samples, 2) if samples else 0.0,
+                'queue_max': maximum
+            }
+        return stats
+
 
 class DiplomaGenerator:
     def __init__(self, portada_template, contraportada_template, output_dir="diplomas_generados"):
@@ -20,6 +1078,23 @@ class DiplomaGenerator:
         self.contraportada_template = contraportada_template
         self.output_dir = output_dir
         
+        # Plantillas decodificadas una sola vez por lote
+        self.template_cache = TemplateCache()
+        # Medidas y glifos de los textos que se repiten entre filas
+        self.text_cache = TextSpriteCache()
+        # Contraportada con los textos fijos ya dibujados
+        self._static_base = None
+        # Layouts compilados (LayoutPlan) por (módulos, escala)
+        self._plans = {}
+        # Módulos de la contraportada; generate_diplomas lo toma de las columnas del CSV
+        self.module_count = DEFAULT_MODULES
+        # Fondos ya comprimidos para el modo PDF vectorial
+        self._pdf_backgrounds = {}
+        # Plantillas reducidas para la vista previa, por ruta
+        self._preview_bases = {}
+        # Tiempos por etapa, bytes escritos y filas terminadas
+        self.metrics = Metrics()
+        
         # Crear directorio de salida si no existe
         os.makedirs(output_dir, exist_ok=True)
         os.makedirs(f"{output_dir}/png", exist_ok=True)
@@ -89,6 +1164,17 @@ class DiplomaGenerator:
             'promedio_y': 930
         }
         
+        # ============================================================
+        # CONFIGURACIÓN DE LAS IMÁGENES DE SALIDA
+        # ============================================================
+        self.output_config = {
+            'format': 'png',       # 'png', 'jpeg' o 'webp'
+            'compress_level': 6,   # Compresión PNG (0 = ninguna, 9 = máxima)
+            'reduce': None,        # None, 'rgb' (quitar alfa opaco) o 'palette' (256 colores)
+            'quality': 90,         # Calidad JPEG/WebP
+            'pdf_jpeg': False      # Incrustar las páginas del PDF como JPEG (DCT)
+        }
+        
         # Cargar las fuentes con las configuraciones
         self.fonts = {
             'nombre': self.get_system_font(self.nombre_config['font_name'], self.nombre_config['size']),
@@ -99,25 +1185,8 @@ class DiplomaGenerator:
         }
         
     def get_system_font(self, font_name, size):
-        """Intenta cargar una fuente del sistema, usa fuente por defecto si falla"""
-        try:
-            font_paths = [
-                f"/System/Library/Fonts/{font_name}",
-                f"/usr/share/fonts/truetype/dejavu/{font_name}",
-                f"C:/Windows/Fonts/{font_name}",
-                font_name
-            ]
-            
-            for path in font_paths:
-                try:
-                    return ImageFont.truetype(path, size)
-                except:
-                    continue
-            
-            print(f"Advertencia: No se pudo cargar la fuente {font_name}, usando fuente por defecto")
-            return ImageFont.load_default()
-        except:
-            return ImageFont.load_default()
+        """Carga una fuente del sistema desde el registro compartido, usa fuente por defecto si falla"""
+        return FONT_REGISTRY.get(font_name, size)
     
     def set_font_config(self, element, size=None, color=None, font_name=None):
         """
@@ -129,16 +1198,10 @@ class DiplomaGenerator:
             color (tuple): Color RGB como tupla (r, g, b)
             font_name (str): Nombre del archivo de fuente
         """
-        configs = {
-            'nombre': self.nombre_config,
-            'folio': self.folio_config,
-            'modulos': self.modulos_config,
-            'total_horas': self.total_horas_config,
-            'promedio_final': self.promedio_final_config
-        }
+        configs = self.get_font_configs()
         
         if element not in configs:
-            print(f"Error: Elemento '{element}' no válido")
+            logger.error(f"Error: Elemento '{element}' no válido")
             return
         
         config = configs[element]
@@ -152,6 +1215,7 @@ class DiplomaGenerator:
         
         # Recargar la fuente con la nueva configuración
         self.fonts[element] = self.get_system_font(config['font_name'], config['size'])
+        self._plans.clear()
     
     def set_portada_coordinates(self, nombre_x=None, nombre_y=None, folio_x=None, folio_y=None):
         """
@@ -171,6 +1235,7 @@ class DiplomaGenerator:
             self.portada_coords['folio_x'] = folio_x
         if folio_y is not None:
             self.portada_coords['folio_y'] = folio_y
+        self._plans.clear()
     
     def set_contraportada_coordinates(self, mod_base_x=None, mod_base_y=None, 
                                      calif_base_x=None, calif_base_y=None,
@@ -208,192 +1273,1574 @@ class DiplomaGenerator:
             self.contraportada_coords['promedio_x'] = promedio_x
         if promedio_y is not None:
             self.contraportada_coords['promedio_y'] = promedio_y
+        self._plans.clear()
     
-    def load_csv_data(self, csv_path):
-        """Carga los datos del CSV"""
-        try:
-            df = pd.read_csv(csv_path)
-            return df
-        except Exception as e:
-            print(f"Error al cargar el archivo CSV: {e}")
-            return None
-    
-    def create_portada(self, nombre, folio, output_path):
+    def set_output_config(self, format=None, compress_level=None, reduce=None, quality=None, pdf_jpeg=None):
         """
-        Genera la portada del diploma con coordenadas configurables
+        Configura la codificación de las imágenes y de las páginas del PDF
         
         Args:
-            nombre (str): Nombre del estudiante
-            folio (str): Número de folio
-            output_path (str): Ruta donde guardar la imagen
+            format (str): 'png', 'jpeg' o 'webp'
+            compress_level (int): Compresión PNG de 0 a 9 (menos = más rápido)
+            reduce (str): 'rgb' para guardar sin canal alfa si la imagen es
+                opaca, 'palette' para además reducirla a 256 colores; 'none'
+                para desactivarlo
+            quality (int): Calidad JPEG/WebP de 1 a 95
+            pdf_jpeg (bool): Entregar las páginas al PDF ya comprimidas en
+                JPEG, que reportlab incrusta sin recomprimir
         """
-        img = Image.open(self.portada_template)
-        draw = ImageDraw.Draw(img)
-        width, height = img.size
+        config = self.output_config
         
-        # Usar coordenadas configuradas o valores por defecto
-        nombre_pos_x = self.portada_coords['nombre_x'] if self.portada_coords['nombre_x'] is not None else width // 2
-        nombre_pos_y = self.portada_coords['nombre_y'] if self.portada_coords['nombre_y'] is not None else height // 2 - 295
-        folio_pos_x = self.portada_coords['folio_x'] if self.portada_coords['folio_x'] is not None else width // 2
-        folio_pos_y = self.portada_coords['folio_y'] if self.portada_coords['folio_y'] is not None else height // 2 - 150
-        
-        folio_text = f"Folio: {folio}"
+        if format is not None:
+            if format not in IMAGE_EXTENSIONS:
+                raise ValueError(f"Formato de imagen no válido: {format}")
+            config['format'] = format
+        if compress_level is not None:
+            config['compress_level'] = compress_level
+        if reduce is not None:
+            if reduce not in ('none', 'rgb', 'palette'):
+                raise ValueError(f"Reducción de color no válida: {reduce}")
+            config['reduce'] = None if reduce == 'none' else reduce
+        if quality is not None:
+            config['quality'] = quality
+        if pdf_jpeg is not None:
+            config['pdf_jpeg'] = pdf_jpeg
+    
+    def encode_image(self, img, image_format=None):
+        """
+        Codifica una página según la configuración de salida
         
-        # Dibujar nombre (centrado horizontalmente respecto a nombre_pos_x)
-        nombre_bbox = draw.textbbox((0, 0), nombre, font=self.fonts['nombre'])
-        nombre_width = nombre_bbox[2] - nombre_bbox[0]
-        nombre_x = nombre_pos_x - (nombre_width // 2)
-        draw.text((nombre_x, nombre_pos_y), nombre, 
-                 fill=self.nombre_config['color'], 
-                 font=self.fonts['nombre'])
+        Args:
+            img (PIL.Image.Image): Página renderizada
+            image_format (str): Formato a usar en lugar del configurado
         
-        # Dibujar folio (centrado horizontalmente respecto a folio_pos_x)
-        folio_bbox = draw.textbbox((0, 0), folio_text, font=self.fonts['folio'])
-        folio_width = folio_bbox[2] - folio_bbox[0]
-        folio_x = folio_pos_x - (folio_width // 2)
-        draw.text((folio_x, folio_pos_y), folio_text, 
-                 fill=self.folio_config['color'], 
-                 font=self.fonts['folio'])
+        Returns:
+            bytes: Imagen codificada
+        """
+        config = self.output_config
+        image_format = image_format or config['format']
+        buffer = io.BytesIO()
         
-        img.save(output_path)
-        print(f"Portada creada: {output_path}")
+        if image_format == 'png':
+            if config['reduce'] and img.mode in ('RGBA', 'LA', 'PA') and not _has_alpha(img):
+                img = img.convert('RGB')
+            if config['reduce'] == 'palette' and img.mode == 'RGB':
+                img = img.quantize(256, method=Image.Quantize.FASTOCTREE)
+            img.save(buffer, format='PNG', compress_level=config['compress_level'])
+        else:
+            # Igual que reportlab con las imágenes RGBA: el alfa se descarta
+            if img.mode != 'RGB':
+                img = img.convert('RGB')
+            img.save(buffer, format='JPEG' if image_format == 'jpeg' else 'WEBP', quality=config['quality'])
+        return buffer.getvalue()
+    
+    def _save_image(self, img, output_path):
+        """Guarda una página en output_path, con el formato que indique su extensión"""
+        extension = os.path.splitext(output_path)[1].lower().lstrip('.')
+        formats = {'png': 'png', 'jpg': 'jpeg', 'jpeg': 'jpeg', 'webp': 'webp'}
+        _write_data(output_path, self.encode_image(img, formats.get(extension)))
     
-    def create_contraportada(self, datos_estudiante, output_path):
+    def _pdf_image(self, img, encoded=None):
         """
-        Genera la contraportada del diploma con coordenadas configurables
-        Todos los elementos se centran respecto a las coordenadas especificadas
+        Imagen de una página lista para reportlab. Con pdf_jpeg se entrega ya
+        comprimida en JPEG y reportlab la incrusta tal cual (DCT); si el
+        archivo de salida ya es JPEG se reutilizan sus bytes.
         
         Args:
-            datos_estudiante (dict): Diccionario con todos los datos del estudiante
-            output_path (str): Ruta donde guardar la imagen
+            img (str | PIL.Image.Image): Ruta o imagen de la página (un archivo
+                abierto se considera ya preparado)
+            encoded (bytes): Bytes ya escritos en el archivo de salida, si los hay
         """
-        img = Image.open(self.contraportada_template)
-        draw = ImageDraw.Draw(img)
-
-        # Usar coordenadas configuradas
-        coords = self.contraportada_coords
-        
-        # Calcular posiciones de módulos (coordenadas centrales)
-        horas_positions = {
-            f'modulo{i}': (coords['mod_base_x'], coords['mod_base_y'] + coords['incremento_y'] * (i - 1))
-            for i in range(1, 5)
-        }
+        config = self.output_config
+        if not config['pdf_jpeg'] or not isinstance(img, (str, Image.Image)):
+            return img
+        if encoded is not None and config['format'] == 'jpeg':
+            return io.BytesIO(encoded)
+        if isinstance(img, str):
+            if os.path.splitext(img)[1].lower() in ('.jpg', '.jpeg'):
+                return img
+            with Image.open(img) as opened:
+                img = opened.convert('RGB')
+        return io.BytesIO(self.encode_image(img, 'jpeg'))
+    
+    def load_data(self, path):
+        """
+        Carga un archivo de datos (CSV, Parquet, Feather/Arrow o XLSX según
+        su extensión) con solo las columnas que usa el generador
         
-        calificaciones_positions = {
-            f'modulo{i}': (coords['calif_base_x'], coords['calif_base_y'] + coords['incremento_y'] * (i - 1))
-            for i in range(1, 5)
-        }
-
-        # Procesar módulos
-        calificaciones = []
-        for i in range(1, 5):
-            horas_val = "30 horas"
-            calif_val = str(datos_estudiante.get(f'modulo{i}_calificacion', '0'))
-            
-            # Dibujar horas (centrado horizontalmente)
-            horas_bbox = draw.textbbox((0, 0), horas_val, font=self.fonts['modulos'])
-            horas_width = horas_bbox[2] - horas_bbox[0]
-            horas_x = horas_positions[f'modulo{i}'][0] - (horas_width // 2)
-            horas_y = horas_positions[f'modulo{i}'][1]
-            draw.text((horas_x, horas_y), horas_val,
-                      fill=self.modulos_config['color'], font=self.fonts['modulos'])
-            
-            # Dibujar calificación (centrado horizontalmente)
-            calif_bbox = draw.textbbox((0, 0), calif_val, font=self.fonts['modulos'])
-            calif_width = calif_bbox[2] - calif_bbox[0]
-            calif_x = calificaciones_positions[f'modulo{i}'][0] - (calif_width // 2)
-            calif_y = calificaciones_positions[f'modulo{i}'][1]
-            draw.text((calif_x, calif_y), calif_val,
-                      fill=self.modulos_config['color'], font=self.fonts['modulos'])
-            
-            try:
-                calificaciones.append(float(calif_val))
-            except ValueError:
-                pass
-
-        # Total de horas (centrado horizontalmente)
-        total_text = "120 horas"
-        total_bbox = draw.textbbox((0, 0), total_text, font=self.fonts['total_horas'])
-        total_width = total_bbox[2] - total_bbox[0]
-        total_x = coords['total_x'] - (total_width // 2)
-        draw.text((total_x, coords['total_y']), total_text,
-                  fill=self.total_horas_config['color'], font=self.fonts['total_horas'])
-
-        # Promedio final (centrado horizontalmente)
-        promedio_final = "{:.2f}".format(sum(calificaciones) / len(calificaciones)) if calificaciones else "0.00"
-        promedio_text = f"Promedio Final: {promedio_final}"
-        promedio_bbox = draw.textbbox((0, 0), promedio_text, font=self.fonts['promedio_final'])
-        promedio_width = promedio_bbox[2] - promedio_bbox[0]
-        promedio_x = coords['promedio_x'] - (promedio_width // 2)
-        draw.text((promedio_x, coords['promedio_y']), promedio_text,
-                  fill=self.promedio_final_config['color'], font=self.fonts['promedio_final'])
-
-        img.save(output_path)
-        print(f"Contraportada creada: {output_path}")
-    
-    def create_pdf(self, portada_path, contraportada_path, output_pdf_path):
-        """Convierte las imágenes PNG a un PDF con dos páginas"""
+        Returns:
+            pandas.DataFrame: Datos, o None si no se pudieron leer
+        """
+        formato = input_format(path)
         try:
-            from reportlab.lib.utils import ImageReader
-            
-            c = canvas.Canvas(output_pdf_path, pagesize=A4)
-            page_width, page_height = A4
-            
-            # Agregar portada
-            portada_img = ImageReader(portada_path)
-            c.drawImage(portada_img, 0, 0, width=page_width, height=page_height, preserveAspectRatio=True)
-            c.showPage()
-            
-            # Agregar contraportada
-            contraportada_img = ImageReader(contraportada_path)
-            c.drawImage(contraportada_img, 0, 0, width=page_width, height=page_height, preserveAspectRatio=True)
-            
-            c.save()
-            print(f"PDF creado: {output_pdf_path}")
-            
+            return read_data(path, formato)
+        except ImportError as e:
+            logger.error(f"Error: Para leer archivos {formato} hace falta instalar "
+                         f"{INPUT_PACKAGES.get(formato, 'pandas')} ({e})")
         except Exception as e:
-            print(f"Error al crear PDF: {e}")
+            logger.error(f"Error al cargar el archivo de datos: {e}")
+        return None
     
-    def generate_diplomas(self, csv_path):
-        """Genera todos los diplomas basados en los datos del CSV"""
-        df = self.load_csv_data(csv_path)
-        if df is None:
-            return
+    def load_csv_data(self, csv_path):
+        """Carga los datos del CSV (admite los mismos formatos que load_data)"""
+        return self.load_data(csv_path)
+    
+    def prepare_records(self, df):
+        """
+        Preprocesa todo el DataFrame con operaciones por columna: convierte las
+        calificaciones a número, calcula los promedios con su formato y genera
+        los nombres de archivo seguros. El bucle de generación solo recorre
+        los registros resultantes.
         
-        print(f"Procesando {len(df)} diplomas...")
+        Args:
+            df (pandas.DataFrame): Datos con las columnas nombre, folio y moduloN_calificacion
         
-        for index, row in df.iterrows():
-            try:
-                nombre = row['nombre']
-                folio = str(row['folio'])
-                
-                safe_name = "".join(c for c in nombre if c.isalnum() or c in (' ', '-', '_')).rstrip()
-                portada_png = f"{self.output_dir}/png/{safe_name}_portada.png"
-                contraportada_png = f"{self.output_dir}/png/{safe_name}_contraportada.png"
-                diploma_pdf = f"{self.output_dir}/pdf/{safe_name}_diploma.pdf"
+        Returns:
+            list: Un Registro por fila
+        """
+        if isinstance(df, CsvTable):
+            return self._prepare_table_records(df)
+        
+        import pandas as pd
+        
+        nombres = df['nombre'].astype(object)
+        # Los nombres que no son texto quedan sin safe_name y se reportan como error
+        # (también si no hay ninguno, como en una columna solo numérica)
+        es_texto = nombres.map(lambda nombre: isinstance(nombre, str)).astype(bool)
+        safe_names = nombres.where(es_texto, '').str.replace(r'[^\w \-]', '', regex=True).str.rstrip()
+        safe_names = safe_names.astype(object).where(es_texto, None)
+        folios = df['folio'].map(str)
+        
+        textos = []
+        suma = pd.Series(0.0, index=df.index)
+        cuenta = pd.Series(0, index=df.index)
+        for i in range(1, module_count(df.columns) + 1):
+            col = f'modulo{i}_calificacion'
+            if col in df.columns:
+                textos.append(df[col].map(str))
+                numeros = pd.to_numeric(df[col], errors='coerce').astype('float64')
+            else:
+                textos.append(pd.Series('0', index=df.index))
+                numeros = pd.Series(0.0, index=df.index)
+            suma = suma + numeros.fillna(0.0)
+            cuenta = cuenta + numeros.notna()
+        
+        promedios = (suma / cuenta.where(cuenta > 0)).map('{:.2f}'.format).where(cuenta > 0, "0.00")
+        
+        return [
+            Registro(nombre, folio, safe_name, calificaciones, promedio)
+            for nombre, folio, safe_name, calificaciones, promedio in zip(
+                nombres.tolist(), folios.tolist(), safe_names.tolist(),
+                zip(*(texto.tolist() for texto in textos)), promedios.tolist())
+        ]
+    
+    def _prepare_table_records(self, table):
+        """
+        prepare_records para un CsvTable, en Python puro y con exactamente
+        el mismo resultado (mismos textos, NaN y sumas en el mismo orden)
+        """
+        nan = float('nan')
+        textos = []
+        numeros = []
+        for i in range(1, module_count(table.columns) + 1):
+            col = f'modulo{i}_calificacion'
+            if col in table.columns:
+                valores = table[col]
+                textos.append([str(valor) for valor in valores])
+                numeros.append([valor if not isinstance(valor, str)
+                                else float(valor) if CsvTable.FLOAT_RE.fullmatch(valor) else nan
+                                for valor in valores])
+            else:
+                textos.append(['0'] * len(table))
+                numeros.append([0.0] * len(table))
+        
+        registros = []
+        for fila, (nombre, folio) in enumerate(zip(table['nombre'], table['folio'])):
+            suma = 0.0
+            cuenta = 0
+            for columna in numeros:
+                if columna[fila] == columna[fila]:  # no es NaN
+                    suma = suma + columna[fila]
+                    cuenta += 1
+            safe_name = re.sub(r'[^\w \-]', '', nombre).rstrip() if isinstance(nombre, str) else None
+            registros.append(Registro(nombre, str(folio), safe_name,
+                                      tuple(texto[fila] for texto in textos),
+                                      '{:.2f}'.format(suma / cuenta) if cuenta > 0 else "0.00"))
+        return registros
+    
+    def read_table(self, csv_path):
+        """
+        Carga los datos para generar: un CSV pequeño y sin ambigüedades se
+        lee con el módulo csv (CsvTable) sin importar pandas; el resto, con
+        load_data. prepare_records admite ambos.
+        """
+        try:
+            if input_format(csv_path) == 'csv' and os.path.getsize(csv_path) <= CSV_STDLIB_MAX_BYTES:
+                table = CsvTable.read(csv_path)
+                if table is not None:
+                    return table
+        except OSError:
+            pass
+        return self.load_data(csv_path)
+    
+    def _as_record(self, datos_estudiante):
+        """Convierte un diccionario de datos en Registro (los Registro pasan tal cual)"""
+        if isinstance(datos_estudiante, Registro):
+            return datos_estudiante
+        
+        import pandas as pd
+        
+        return self.prepare_records(pd.DataFrame([datos_estudiante]))[0]
+    
+    def get_font_configs(self):
+        """Devuelve la configuración de fuente de cada elemento"""
+        return {
+            'nombre': self.nombre_config,
+            'folio': self.folio_config,
+            'modulos': self.modulos_config,
+            'total_horas': self.total_horas_config,
+            'promedio_final': self.promedio_final_config
+        }
+    
+    def layout_plan(self, modulos=None, scale=1):
+        """
+        Devuelve el layout compilado (LayoutPlan) para ese número de módulos;
+        se compila una vez y se reutiliza hasta que cambia la configuración
+        
+        Args:
+            modulos (int): Número de módulos (None = module_count)
+            scale (float): Escala de las fuentes (vista previa)
+        """
+        key = (self.module_count if modulos is None else modulos, scale)
+        plan = self._plans.get(key)
+        if plan is None:
+            fonts = self.fonts if scale == 1 else self.preview_fonts(scale)
+            plan = LayoutPlan(fonts, self.get_font_configs(), self.portada_coords, self.contraportada_coords, key[0])
+            self._plans[key] = plan
+        return plan
+    
+    def portada_layout(self, nombre, folio, size):
+        """
+        Calcula los textos de la portada y su posición
+        
+        Args:
+            nombre (str): Nombre del estudiante
+            folio (str): Número de folio
+            size (tuple): Tamaño (ancho, alto) de la plantilla en píxeles
+        
+        Returns:
+            list: Tuplas (TextStyle, texto, x, y); el texto se centra
+                horizontalmente respecto a x y su parte superior queda en y
+        """
+        return self.layout_plan().portada_layout(nombre, folio, size)
+    
+    def contraportada_static_layout(self, modulos=None):
+        """
+        Textos de la contraportada que no dependen de la fila (las horas de
+        cada módulo y el total); se dibujan una vez sobre la plantilla
+        
+        Args:
+            modulos (int): Número de módulos (None = module_count)
+        
+        Returns:
+            list: Tuplas (TextStyle, texto, x, y)
+        """
+        return list(self.layout_plan(modulos).static_layout)
+    
+    def contraportada_row_layout(self, datos_estudiante):
+        """
+        Textos de la contraportada que dependen del estudiante: las
+        calificaciones de cada módulo y el promedio final
+        
+        Args:
+            datos_estudiante (dict | Registro): Datos del estudiante
+        
+        Returns:
+            list: Tuplas (TextStyle, texto, x, y)
+        """
+        registro = self._as_record(datos_estudiante)
+        return self.layout_plan(len(registro.calificaciones)).row_layout(registro)
+    
+    def contraportada_layout(self, datos_estudiante):
+        """
+        Calcula todos los textos de la contraportada y su posición
+        
+        Args:
+            datos_estudiante (dict | Registro): Datos del estudiante
+        
+        Returns:
+            list: Tuplas (TextStyle, texto, x, y) en el orden en que se dibujan
+        """
+        registro = self._as_record(datos_estudiante)
+        plan = self.layout_plan(len(registro.calificaciones))
+        return list(plan.static_layout) + plan.row_layout(registro)
+    
+    def _contraportada_base(self, modulos=None):
+        """
+        Devuelve la plantilla de contraportada con los textos fijos ya
+        dibujados. Se reconstruye cuando cambia la plantilla o el layout
+        compilado (coordenadas, fuentes, colores o número de módulos).
+        """
+        base = self.template_cache.get(self.contraportada_template)
+        plan = self.layout_plan(modulos)
+        
+        cached = self._static_base
+        if cached is None or cached[0] is not base or cached[1] is not plan:
+            baked = base.copy()
+            self.draw_layout(baked, plan.static_layout)
+            cached = (base, plan, baked)
+            self._static_base = cached
+        return cached[2]
+    
+    def _set_contraportada_base(self, baked):
+        """Usa una contraportada con los textos fijos ya dibujados por otro proceso"""
+        base = self.template_cache.get(self.contraportada_template)
+        self._static_base = (base, self.layout_plan(), baked)
+    
+    def draw_layout(self, img, layout):
+        """Dibuja sobre la imagen los textos del layout, centrados en su x"""
+        draw = None
+        
+        for style, text, pos_x, pos_y in layout:
+            font = style.font
+            color = style.color
+            sprite = self.text_cache.get(font, color, text) if style.cached else None
+            
+            if sprite is None:
+                # Texto propio de la fila, o fuente sin caché (fuente por defecto de PIL)
+                draw = draw or ImageDraw.Draw(img)
+                bbox = draw.textbbox((0, 0), text, font=font)
+                draw.text((pos_x - ((bbox[2] - bbox[0]) // 2), pos_y), text, fill=color, font=font)
+                continue
+            
+            bbox, mask = sprite
+            if mask is not None:
+                text_x = pos_x - ((bbox[2] - bbox[0]) // 2)
+                img.paste(color, (text_x + bbox[0], pos_y + bbox[1]), mask)
+    
+    def create_portada(self, nombre, folio, output_path=None):
+        """
+        Genera la portada del diploma con coordenadas configurables
+        
+        Args:
+            nombre (str): Nombre del estudiante
+            folio (str): Número de folio
+            output_path (str): Ruta donde guardar la imagen (None = no guardar)
+        
+        Returns:
+            PIL.Image.Image: Imagen de la portada
+        """
+        with self.metrics.stage('template'):
+            img = self.template_cache.canvas(self.portada_template)
+        with self.metrics.stage('text_layout'):
+            self.draw_layout(img, self.portada_layout(nombre, folio, img.size))
+        
+        if output_path is not None:
+            self._save_image(img, output_path)
+            logger.info(f"Portada creada: {output_path}")
+        return img
+    
+    def create_contraportada(self, datos_estudiante, output_path=None):
+        """
+        Genera la contraportada del diploma con coordenadas configurables
+        Todos los elementos se centran respecto a las coordenadas especificadas
+        
+        Args:
+            datos_estudiante (dict | Registro): Datos del estudiante
+            output_path (str): Ruta donde guardar la imagen (None = no guardar)
+        
+        Returns:
+            PIL.Image.Image: Imagen de la contraportada
+        """
+        registro = self._as_record(datos_estudiante)
+        plan = self.layout_plan(len(registro.calificaciones))
+        with self.metrics.stage('template'):
+            img = self._contraportada_base(plan.modulos).copy()
+        with self.metrics.stage('text_layout'):
+            self.draw_layout(img, plan.row_layout(registro))
+
+        if output_path is not None:
+            self._save_image(img, output_path)
+            logger.info(f"Contraportada creada: {output_path}")
+        return img
+    
+    def _preview_base(self, template, scale):
+        """Plantilla reducida a la escala de la vista previa (se reduce una sola vez)"""
+        base = self.template_cache.get(template)
+        key = os.path.abspath(template)
+        cached = self._preview_bases.get(key)
+        if cached is None or cached[0] is not base or cached[1] != scale:
+            size = (max(1, round(base.width * scale)), max(1, round(base.height * scale)))
+            cached = (base, scale, base.resize(size, Image.BILINEAR, reducing_gap=2.0))
+            self._preview_bases[key] = cached
+        return base.size, cached[2]
+    
+    def preview_fonts(self, scale):
+        """Fuentes de cada elemento con el tamaño llevado a la escala indicada"""
+        fonts = {}
+        for element, config in self.get_font_configs().items():
+            if isinstance(getattr(self.fonts[element], 'path', None), str):
+                fonts[element] = FONT_REGISTRY.get(config['font_name'], max(1, round(config['size'] * scale)))
+            else:
+                fonts[element] = self.fonts[element]
+        return fonts
+    
+    def render_preview(self, datos_estudiante, page='portada', scale=0.25):
+        """
+        Renderiza una página real de un estudiante a resolución reducida, con
+        las fuentes y las coordenadas escaladas igual que la plantilla. Pensado
+        para refrescar la vista previa mientras se ajusta la configuración.
+        
+        Args:
+            datos_estudiante (dict | Registro): Datos del estudiante
+            page (str): 'portada' o 'contraportada'
+            scale (float): Escala respecto a la plantilla (0.25 = un cuarto)
+        
+        Returns:
+            PIL.Image.Image: Imagen de la página a escala reducida
+        """
+        registro = self._as_record(datos_estudiante)
+        plan = self.layout_plan(len(registro.calificaciones), scale)
+        if page == 'portada':
+            size, base = self._preview_base(self.portada_template, scale)
+            layout = plan.portada_layout(registro.nombre, registro.folio, size)
+        elif page == 'contraportada':
+            size, base = self._preview_base(self.contraportada_template, scale)
+            layout = list(plan.static_layout) + plan.row_layout(registro)
+        else:
+            raise ValueError(f"Página no válida: {page}")
+        
+        img = base.copy()
+        scaled_layout = [(style, text, round(x * scale), round(y * scale)) for style, text, x, y in layout]
+        self.draw_layout(img, scaled_layout)
+        return img
+    
+    def create_pdf(self, portada, contraportada, output_pdf_path):
+        """
+        Convierte las imágenes a un PDF con dos páginas
+        
+        Args:
+            portada (str | PIL.Image.Image): Ruta del PNG o imagen en memoria de la portada
+            contraportada (str | PIL.Image.Image): Ruta del PNG o imagen en memoria de la contraportada
+            output_pdf_path (str): Ruta donde guardar el PDF
+        """
+        try:
+            self._write_pdf(portada, contraportada, output_pdf_path)
+            logger.info(f"PDF creado: {output_pdf_path}")
+            
+        except Exception as e:
+            logger.error(f"Error al crear PDF: {e}")
+    
+    def _write_pdf(self, portada, contraportada, target):
+        """Escribe el PDF de dos páginas en una ruta o archivo abierto"""
+        from reportlab.lib.pagesizes import A4
+        from reportlab.lib.utils import ImageReader
+        from reportlab.pdfgen import canvas
+        
+        c = canvas.Canvas(target, pagesize=A4)
+        page_width, page_height = A4
+        
+        # Agregar portada
+        portada_img = ImageReader(self._pdf_image(portada))
+        c.drawImage(portada_img, 0, 0, width=page_width, height=page_height, preserveAspectRatio=True)
+        c.showPage()
+        
+        # Agregar contraportada
+        contraportada_img = ImageReader(self._pdf_image(contraportada))
+        c.drawImage(contraportada_img, 0, 0, width=page_width, height=page_height, preserveAspectRatio=True)
+        
+        c.save()
+    
+    def _pdf_text_ops(self, layout, size):
+        """
+        Convierte un layout en operaciones de texto vectorial para el PDF,
+        con las coordenadas de la plantilla llevadas a la página A4
+        
+        Args:
+            layout (list): Tuplas (TextStyle, texto, x, y) en píxeles
+            size (tuple): Tamaño (ancho, alto) de la plantilla en píxeles
+        
+        Returns:
+            list: Tuplas (fuente, tamaño, color, x, y, texto) en puntos
+        """
+        offset_x, offset_y, scale = _page_transform(size)
+        height = size[1]
+        
+        ops = []
+        for style, text, pos_x, pos_y in layout:
+            font = style.font
+            font_name = _register_pdf_font(getattr(font, 'path', None))
+            font_size = style.size * scale
+            # PIL coloca la parte superior del texto en y; el PDF dibuja sobre la línea base
+            ascent = font.getmetrics()[0] if hasattr(font, 'getmetrics') else 0
+            # Misma regla de centrado que en la imagen, medida con PIL
+            sprite = self.text_cache.get(font, style.color, text, render=False) if style.cached else None
+            bbox = sprite[0] if sprite is not None else _measure_draw().textbbox((0, 0), text, font=font)
+            text_x = pos_x - ((bbox[2] - bbox[0]) // 2)
+            
+            x = offset_x + text_x * scale
+            y = offset_y + (height - pos_y - ascent) * scale
+            ops.append((font_name, font_size, style.pdf_color, x, y, text))
+        return ops
+    
+    @staticmethod
+    def _draw_pdf_text(c, ops):
+        """Dibuja sobre la página actual las operaciones de _pdf_text_ops"""
+        for font_name, font_size, color, x, y, text in ops:
+            c.setFillColorRGB(*color)
+            c.setFont(font_name, font_size)
+            c.drawString(x, y, text)
+    
+    def _draw_pdf_background(self, c, template_path, base=None):
+        """
+        Dibuja la plantilla como fondo de la página actual. Si la versión de
+        reportlab lo permite (_shares_xobjects), la imagen se comprime una
+        sola vez por lote y cada PDF recibe un XObject nuevo con esos mismos
+        datos; si no, se dibuja con drawImage, que la recomprime en cada PDF.
+        
+        Args:
+            base (PIL.Image.Image): Plantilla ya decodificada (None = de la caché)
+        """
+        from reportlab.lib.pagesizes import A4
+        from reportlab.lib.utils import ImageReader
+        
+        if base is None:
+            base = self.template_cache.get(template_path)
+        page_width, page_height = A4
+        if not _shares_xobjects(c):
+            c.drawImage(ImageReader(self._pdf_image(base)), 0, 0, width=page_width, height=page_height,
+                        preserveAspectRatio=True)
+            return base.size
+        
+        from reportlab.lib.boxstuff import aspectRatioFix
+        from reportlab.pdfbase.pdfdoc import PDFImageXObject
+        
+        abs_path = os.path.abspath(template_path)
+        encoding = (self.output_config['pdf_jpeg'], self.output_config['quality'])
+        cached = self._pdf_backgrounds.get(abs_path)
+        if cached is None or cached[0] is not base or cached[1] != encoding:
+            comprimida = PDFImageXObject(f"fondo{len(self._pdf_backgrounds)}", ImageReader(self._pdf_image(base)))
+            cached = (base, encoding, {attr: getattr(comprimida, attr) for attr in XOBJECT_FIELDS})
+            self._pdf_backgrounds[abs_path] = cached
+        # XObject propio de este documento con los datos ya comprimidos
+        xobject = PDFImageXObject(cached[2]['name'])
+        for attr, value in cached[2].items():
+            setattr(xobject, attr, value)
+        
+        # Registro del XObject en el documento, igual que hace canvas.drawImage
+        reg_name = c._doc.getXObjectName(xobject.name)
+        if reg_name not in c._doc.idToObject:
+            c._setXObjects(xobject)
+            c._doc.Reference(xobject, reg_name)
+            c._doc.addForm(xobject.name, xobject)
+        
+        x, y, width, height, _ = aspectRatioFix(True, 'c', 0, 0, page_width, page_height,
+                                                xobject.width, xobject.height)
+        c._currentPageHasImages = 1
+        c.saveState()
+        c.translate(x, y)
+        c.scale(width, height)
+        c._code.append(f"/{reg_name} Do")
+        c.restoreState()
+        c._formsinuse.append(xobject.name)
+        return base.size
+    
+    def create_pdf_vector(self, datos_estudiante, output_pdf_path):
+        """
+        Genera el PDF de dos páginas con el texto como glifos vectoriales
+        (fuentes TTF incrustadas) sobre la plantilla, sin rasterizar nada
+        por estudiante
+        
+        Args:
+            datos_estudiante (dict | Registro): Datos del estudiante
+            output_pdf_path (str): Ruta donde guardar el PDF
+        """
+        try:
+            self._write_pdf_vector(datos_estudiante, output_pdf_path)
+            logger.info(f"PDF creado: {output_pdf_path}")
+            
+        except Exception as e:
+            logger.error(f"Error al crear PDF: {e}")
+    
+    def _pdf_vector_pages(self, datos_estudiante):
+        """
+        Fondo y textos vectoriales de cada página del PDF de un estudiante
+        
+        Returns:
+            list: Tuplas (ruta de la plantilla, plantilla decodificada, operaciones de texto)
+        """
+        registro = self._as_record(datos_estudiante)
+        portada = self.template_cache.get(self.portada_template)
+        contraportada = self.template_cache.get(self.contraportada_template)
+        return [
+            (self.portada_template, portada, self._pdf_text_ops(
+                self.portada_layout(registro.nombre, registro.folio, portada.size), portada.size)),
+            (self.contraportada_template, contraportada, self._pdf_text_ops(
+                self.contraportada_layout(registro), contraportada.size))
+        ]
+    
+    def _write_pdf_vector(self, datos_estudiante, target, pages=None):
+        """
+        Escribe el PDF vectorial en una ruta o archivo abierto
+        
+        Args:
+            pages (list): Páginas ya calculadas con _pdf_vector_pages (None = calcularlas)
+        """
+        from reportlab.lib.pagesizes import A4
+        from reportlab.pdfgen import canvas
+        
+        if pages is None:
+            pages = self._pdf_vector_pages(datos_estudiante)
+        
+        c = canvas.Canvas(target, pagesize=A4)
+        for i, (template_path, base, ops) in enumerate(pages):
+            if i:
+                c.showPage()
+            self._draw_pdf_background(c, template_path, base)
+            self._draw_pdf_text(c, ops)
+        c.save()
+    
+    def _generate_merged(self, registros, output_pdf_path):
+        """
+        Genera un único PDF con los diplomas de todos los registros. Cada
+        plantilla se incrusta una sola vez como formulario (XObject) que se
+        reutiliza en todas las páginas; encima solo se dibuja el texto de
+        cada estudiante. Devuelve (registro, error, None) por fila. Si se
+        cierra antes de terminar (cancelación), guarda el PDF con las filas
+        ya entregadas.
+        """
+        from reportlab.lib.pagesizes import A4
+        from reportlab.lib.utils import ImageReader
+        from reportlab.pdfgen import canvas
+        
+        portada_base = self.template_cache.get(self.portada_template)
+        contraportada_base = self.template_cache.get(self.contraportada_template)
+        
+        c = canvas.Canvas(output_pdf_path, pagesize=A4)
+        page_width, page_height = A4
+        
+        for form_name, base, static_layout in (('portada', portada_base, []),
+                                               ('contraportada', contraportada_base, self.contraportada_static_layout())):
+            c.beginForm(form_name)
+            c.drawImage(ImageReader(self._pdf_image(base)), 0, 0, width=page_width, height=page_height,
+                        preserveAspectRatio=True)
+            # Los textos fijos forman parte del formulario compartido
+            self._draw_pdf_text(c, self._pdf_text_ops(static_layout, base.size))
+            c.endForm()
+        
+        try:
+            for registro in registros:
+                try:
+                    nombre = _check_record(registro)
+                    portada_ops = self._pdf_text_ops(
+                        self.portada_layout(nombre, registro.folio, portada_base.size), portada_base.size)
+                    contraportada_ops = self._pdf_text_ops(
+                        self.contraportada_row_layout(registro), contraportada_base.size)
+                except Exception as e:
+                    yield registro, e, None
+                    continue
                 
-                self.create_portada(nombre, folio, portada_png)
-                self.create_contraportada(row.to_dict(), contraportada_png)
-                self.create_pdf(portada_png, contraportada_png, diploma_pdf)
+                c.doForm('portada')
+                self._draw_pdf_text(c, portada_ops)
+                c.showPage()
                 
-                print(f"Diploma completado para: {nombre}")
+                c.doForm('contraportada')
+                self._draw_pdf_text(c, contraportada_ops)
+                c.showPage()
                 
+                logger.info(f"Diploma completado para: {nombre}")
+                yield registro, None, None
+        except GeneratorExit:
+            # Cancelado: el PDF conserva los diplomas ya entregados
+            c.save()
+            logger.info(f"PDF parcial creado: {output_pdf_path}")
+            raise
+        
+        c.save()
+        logger.info(f"PDF creado: {output_pdf_path}")
+    
+    def get_cache_stats(self):
+        """Estadísticas de las cachés de plantillas, de textos y del registro de fuentes"""
+        return {
+            'templates': self.template_cache.stats(),
+            'text': self.text_cache.stats(),
+            'fonts': FONT_REGISTRY.stats()
+        }
+    
+    def get_config(self):
+        """
+        Devuelve la configuración completa del generador (plantillas, fuentes
+        y coordenadas) como un diccionario serializable
+        """
+        return {
+            'portada_template': self.portada_template,
+            'contraportada_template': self.contraportada_template,
+            'output_dir': self.output_dir,
+            'fonts': {
+                'nombre': dict(self.nombre_config),
+                'folio': dict(self.folio_config),
+                'modulos': dict(self.modulos_config),
+                'total_horas': dict(self.total_horas_config),
+                'promedio_final': dict(self.promedio_final_config)
+            },
+            'portada_coords': dict(self.portada_coords),
+            'contraportada_coords': dict(self.contraportada_coords),
+            'modules': self.module_count,
+            'output': dict(self.output_config, reduce=self.output_config['reduce'] or 'none')
+        }
+    
+    @classmethod
+    def from_config(cls, config):
+        """Crea un generador a partir de un diccionario de get_config()"""
+        generator = cls(config['portada_template'], config['contraportada_template'], config['output_dir'])
+        for element, font_config in config['fonts'].items():
+            generator.set_font_config(element, **font_config)
+        generator.set_portada_coordinates(**config['portada_coords'])
+        generator.set_contraportada_coordinates(**config['contraportada_coords'])
+        generator.module_count = config.get('modules', DEFAULT_MODULES)
+        generator.set_output_config(**config.get('output', {}))
+        return generator
+    
+    def _save_output(self, message, rel_path, write, archive=None, write_files=True):
+        """
+        Guarda un archivo generado en el directorio de salida y/o en el ZIP
+        
+        Args:
+            message (str): Texto del aviso al terminar ("Portada creada", ...)
+            rel_path (str): Ruta dentro del directorio de salida ('png/...', 'pdf/...')
+            write (callable): Función que escribe el contenido en una ruta o archivo
+            archive (ArchiveWriter): ZIP abierto donde añadir el archivo
+            write_files (bool): Escribir también el archivo suelto
+        """
+        path = f"{self.output_dir}/{rel_path}"
+        kind = os.path.splitext(rel_path)[1].lstrip('.')
+        stage = 'pdf_write' if kind == 'pdf' else 'image_encode'
+        if archive is None:
+            with self.metrics.stage(stage):
+                write(path)
+            self.metrics.record_bytes(kind, os.path.getsize(path))
+        else:
+            buffer = io.BytesIO()
+            with self.metrics.stage(stage):
+                write(buffer)
+            data = buffer.getvalue()
+            with self.metrics.stage('zip_write'):
+                archive.write(rel_path, data)
+            if write_files:
+                with open(path, 'wb') as f:
+                    f.write(data)
+            self.metrics.record_bytes(kind, len(data))
+        logger.info(f"{message}: {path if write_files else rel_path}")
+    
+    def _store_output(self, message, rel_path, data, archive=None, write_files=True):
+        """Como _save_output, con el contenido ya generado en memoria"""
+        path = f"{self.output_dir}/{rel_path}"
+        if archive is not None:
+            with self.metrics.stage('zip_write'):
+                archive.write(rel_path, data)
+        if write_files:
+            with self.metrics.stage('file_write'):
+                _write_data(path, data)
+        self.metrics.record_bytes(os.path.splitext(rel_path)[1].lstrip('.'), len(data))
+        logger.info(f"{message}: {path if write_files else rel_path}")
+    
+    def process_row(self, datos_estudiante, save_png=True, pdf_mode='raster', archive=None,
+                    write_files=True, pages=None):
+        """
+        Genera la portada, la contraportada y el PDF de un estudiante. Las
+        imágenes pasan al PDF en memoria, sin volver a leerse del disco.
+        
+        Args:
+            datos_estudiante (dict | Registro): Datos del estudiante
+            save_png (bool): Guardar también las imágenes PNG de cada página
+            pdf_mode (str): 'raster' (texto dentro de la imagen) o 'vector'
+                (texto vectorial con las fuentes incrustadas)
+            archive (ArchiveWriter): ZIP donde escribir cada archivo al generarlo
+            write_files (bool): Escribir los archivos sueltos en el directorio de salida
+            pages (set): Salidas a escribir ('portada', 'contraportada', 'pdf');
+                None = todas. Con save_png, una página que no se reescribe se
+                lee de su PNG si el PDF la necesita; sin save_png se renderiza
+                en memoria (ver _reusable_page).
+        
+        Returns:
+            str: Nombre del estudiante procesado
+        """
+        registro = self._as_record(datos_estudiante)
+        nombre = _check_record(registro)
+        rel_paths = self.output_paths(registro.safe_name)
+        if pages is None:
+            pages = set(PAGES)
+        
+        need_images = pdf_mode == 'raster' and 'pdf' in pages
+        images = {}
+        encoded = {}
+        for page, render in (('portada', lambda: self.create_portada(nombre, registro.folio)),
+                             ('contraportada', lambda: self.create_contraportada(registro))):
+            if page in pages and save_png:
+                images[page] = render()
+                self._save_output(f"{page.capitalize()} creada", rel_paths[page],
+                                  lambda target: _write_data(target, encoded.setdefault(page, self.encode_image(images[page]))),
+                                  archive, write_files)
+            elif need_images:
+                images[page] = self._reusable_page(page, pages, save_png, rel_paths[page]) or render()
+        
+        if 'pdf' in pages:
+            if pdf_mode == 'vector':
+                write_pdf = lambda target: self._write_pdf_vector(registro, target)
+            else:
+                write_pdf = lambda target: self._write_pdf(self._pdf_image(images['portada'], encoded.get('portada')),
+                                                           self._pdf_image(images['contraportada'], encoded.get('contraportada')),
+                                                           target)
+            self._save_output("PDF creado", rel_paths['pdf'], write_pdf, archive, write_files)
+        
+        logger.info(f"Diploma completado para: {nombre}")
+        return nombre
+    
+    def _reusable_page(self, page, pages, save_png, rel_path):
+        """
+        Ruta del PNG de una página que no se regenera y sigue al día, o None
+        si hay que renderizarla. Solo con save_png: entonces _plan_incremental
+        deja la página fuera de pages únicamente si su huella coincide con el
+        manifiesto; sin PNG su huella no se compara y el archivo puede ser de
+        datos anteriores.
+        """
+        path = f"{self.output_dir}/{rel_path}"
+        if save_png and page not in pages and os.path.exists(path):
+            return path
+        return None
+    
+    def output_paths(self, safe_name):
+        """Rutas relativas de los archivos de un estudiante, por página"""
+        extension = IMAGE_EXTENSIONS[self.output_config['format']]
+        return {
+            'portada': f"png/{safe_name}_portada.{extension}",
+            'contraportada': f"png/{safe_name}_contraportada.{extension}",
+            'pdf': f"pdf/{safe_name}_diploma.pdf"
+        }
+    
+    def _fingerprint_config(self, pdf_mode):
+        """
+        Parte de las huellas que no depende de la fila: contenido de las
+        plantillas, configuración de fuentes y coordenadas de cada página y
+        codificación de los archivos
+        """
+        configs = self.get_font_configs()
+        
+        def font_key(element):
+            font = self.fonts[element]
+            path = getattr(font, 'path', None)
+            return [path if isinstance(path, str) else None, getattr(font, 'size', None),
+                    list(configs[element]['color'])]
+        
+        output = self.output_config
+        return {
+            'portada': [_file_hash(self.portada_template), self.portada_coords,
+                        [font_key(e) for e in ('nombre', 'folio')], output],
+            'contraportada': [_file_hash(self.contraportada_template), self.contraportada_coords,
+                              [font_key(e) for e in ('modulos', 'total_horas', 'promedio_final')], output],
+            'pdf': [pdf_mode, output['quality'] if output['pdf_jpeg'] else None]
+        }
+    
+    @staticmethod
+    def _fingerprints(registro, config):
+        """Huella de cada salida de un registro (ver _fingerprint_config)"""
+        portada = _hash_data([config['portada'], registro.nombre, registro.folio])
+        contraportada = _hash_data([config['contraportada'], list(registro.calificaciones), registro.promedio])
+        return {
+            'portada': portada,
+            'contraportada': contraportada,
+            'pdf': _hash_data([config['pdf'], portada, contraportada])
+        }
+    
+    def _plan_incremental(self, registros, manifest, save_png, pdf_mode):
+        """
+        Compara cada registro con el manifiesto y elimina los huérfanos
+        
+        Returns:
+            tuple: (tareas, sin_cambios, huellas) donde tareas son pares
+                (registro, páginas a regenerar)
+        """
+        config = self._fingerprint_config(pdf_mode)
+        expected = [page for page in PAGES if save_png or page == 'pdf']
+        
+        tareas = []
+        sin_cambios = []
+        huellas = {}
+        for registro in registros:
+            if registro.safe_name is None:
+                tareas.append((registro, None))
+                continue
+            
+            huellas[registro.safe_name] = actual = self._fingerprints(registro, config)
+            entry = manifest.get(registro.safe_name)
+            rel_paths = self.output_paths(registro.safe_name)
+            pages = {
+                page for page in expected
+                if entry is None or entry.get(page) != actual[page]
+                or not os.path.exists(f"{self.output_dir}/{rel_paths[page]}")
+            }
+            if pages:
+                tareas.append((registro, pages))
+            else:
+                sin_cambios.append(registro)
+        
+        # Filas que ya no están en los datos: se borran sus archivos
+        huerfanos = [key for key in manifest.keys() if key not in huellas]
+        for key in huerfanos:
+            for rel_path in manifest.get(key).get('files', []):
+                path = f"{self.output_dir}/{rel_path}"
+                if os.path.exists(path):
+                    os.remove(path)
+            manifest.remove(key)
+        if huerfanos:
+            logger.info(f"Archivos huérfanos eliminados: {len(huerfanos)} estudiantes")
+        
+        return tareas, sin_cambios, huellas
+    
+    def generate_diplomas(self, csv_path, workers=1, progress_callback=None, save_png=True,
+                          merged_pdf=None, pdf_mode='raster', zip_path=None, write_files=True,
+                          incremental=False, cancel_event=None, pipeline=False, encode_threads=2,
+                          queue_depth=2, shard=None):
+        """
+        Genera todos los diplomas basados en los datos del CSV
+        
+        Args:
+            csv_path (str): Ruta del archivo de datos: CSV, Parquet,
+                Feather/Arrow o XLSX (ver INPUT_FORMATS)
+            workers (int): Número de procesos en paralelo (1 = en serie)
+            progress_callback (callable): Función opcional llamada tras cada fila
+                como progress_callback(completados, total, nombre, error)
+            save_png (bool): Guardar también los PNG (False = solo PDF)
+            merged_pdf (str): Si se indica, genera solo este PDF con todos los
+                diplomas, con las plantillas incrustadas una única vez
+            pdf_mode (str): 'raster' o 'vector' para los PDF individuales
+            zip_path (str): Si se indica, cada archivo se escribe en este ZIP en
+                cuanto se genera (PNG y PDF sin recomprimir)
+            write_files (bool): Escribir los archivos sueltos; con False solo se
+                genera el ZIP
+            incremental (bool): Regenerar solo las páginas cuya huella cambió
+                respecto al manifiesto del directorio de salida
+            cancel_event (threading.Event): Si se activa, la generación se
+                detiene tras la fila en curso; lo ya generado se conserva
+            pipeline (bool): Generar por etapas (renderizado, codificación, PDF
+                y escritura) conectadas por colas acotadas; solo en un proceso
+                (workers=1) y sin merged_pdf
+            encode_threads (int): Hilos de la etapa de codificación
+            queue_depth (int): Capacidad de cada cola entre etapas
+            shard (tuple): (i, N) para generar solo el fragmento i de N del CSV
+                (las filas con shard_of(folio, N) == i) y dejar en shard.json
+                lo necesario para unir los fragmentos con merge_shards
+        
+        Returns:
+            int: Número de diplomas generados correctamente
+        """
+        df = self.read_table(csv_path)
+        if df is None:
+            return
+        
+        total = len(df)
+        self.metrics.reset()
+        logger.info(f"Procesando {total} diplomas...")
+        
+        missing_cols = [col for col in ('nombre', 'folio') if col not in df.columns]
+        if missing_cols:
+            logger.error(f"Error: Faltan columnas en los datos: {', '.join(missing_cols)}")
+            return
+        
+        self.module_count = module_count(df.columns)
+        registros = self.prepare_records(df)
+        filas_csv = list(range(len(registros)))
+        if shard is not None:
+            indice, fragmentos = shard
+            if not 1 <= indice <= fragmentos:
+                raise ValueError(f"Fragmento no válido: {indice}/{fragmentos}")
+            filas_csv = [i for i, registro in enumerate(registros) if shard_of(registro.folio, fragmentos) == indice]
+            registros = [registros[i] for i in filas_csv]
+            total = len(registros)
+            logger.info(f"Fragmento {indice}/{fragmentos}: {total} de {len(df)} filas")
+        if pdf_mode not in ('raster', 'vector'):
+            raise ValueError(f"Modo de PDF no válido: {pdf_mode}")
+        if not write_files and zip_path is None:
+            raise ValueError("Sin archivos sueltos es necesario indicar zip_path")
+        if incremental and (merged_pdf is not None or not write_files):
+            raise ValueError("El modo incremental necesita archivos sueltos y no admite merged_pdf")
+        
+        manifest = None
+        huellas = {}
+        sin_cambios = []
+        tareas = [(registro, None) for registro in registros]
+        if incremental:
+            manifest = Manifest(self.output_dir)
+            tareas, sin_cambios, huellas = self._plan_incremental(registros, manifest, save_png, pdf_mode)
+            logger.info(f"Sin cambios: {len(sin_cambios)}, por regenerar: {len(tareas)}")
+        
+        archive = ArchiveWriter(zip_path) if zip_path is not None else None
+        opciones = {'save_png': save_png, 'pdf_mode': pdf_mode, 'write_files': write_files}
+        parallel = workers > 1 and len(tareas) > 1 and merged_pdf is None
+        merged_target = None
+        etapas = None
+        if merged_pdf is not None:
+            merged_target = merged_pdf if write_files else io.BytesIO()
+            resultados = self._generate_merged(registros, merged_target)
+        elif parallel:
+            resultados = self._generate_parallel(tareas, workers, opciones, archive)
+        elif pipeline:
+            etapas = self.row_pipeline(dict(opciones, archive=archive), encode_threads, queue_depth)
+            resultados = self._generate_pipelined(etapas, tareas)
+        else:
+            resultados = self._generate_serial(tareas, dict(opciones, archive=archive))
+        
+        completados = 0
+        generados = 0
+        cancelado = False
+        errores = {}
+        filas = self._with_unchanged(sin_cambios, resultados, archive, save_png)
+        try:
+            for registro, error in filas:
+                nombre = _record_name(registro)
+                completados += 1
+                self.metrics.record_row(nombre, error)
+                errores[id(registro)] = error
+                if error is None:
+                    generados += 1
+                    if manifest is not None and registro.safe_name in huellas:
+                        self._record_manifest(manifest, registro, huellas[registro.safe_name], save_png)
+                else:
+                    logger.error(f"Error procesando diploma para {nombre}: {error}")
+                if progress_callback is not None:
+                    progress_callback(completados, total, nombre, error)
+                if cancel_event is not None and cancel_event.is_set():
+                    cancelado = True
+                    logger.warning(f"Generación cancelada tras {completados} de {total} diplomas")
+                    break
+            
+            # Cierra la generación antes de añadir el PDF único al ZIP: al
+            # cancelar, así se guarda primero con las filas ya procesadas
+            filas.close()
+            resultados.close()
+            if archive is not None and merged_target is not None:
+                if write_files:
+                    archive.write_file(merged_pdf, f"pdf/{os.path.basename(merged_pdf)}")
+                else:
+                    archive.write(f"pdf/{os.path.basename(merged_pdf)}", merged_target.getvalue())
+        finally:
+            # Detiene la generación pendiente si se salió antes de terminar
+            filas.close()
+            resultados.close()
+            if archive is not None:
+                archive.close()
+                logger.info(f"ZIP creado: {zip_path}")
+            if manifest is not None:
+                manifest.save()
+            if etapas is not None:
+                self.metrics.pipeline = etapas.stats()
+            if shard is not None:
+                self._write_shard(csv_path, shard, len(df), filas_csv, registros, errores,
+                                  save_png, merged_pdf, zip_path, complete=not cancelado)
+            self.metrics.finish()
+        
+        if not parallel:
+            stats = self.template_cache.stats()
+            logger.info(f"Caché de plantillas: {stats['hits']} aciertos, {stats['misses']} fallos")
+            stats = self.text_cache.stats()
+            logger.info(f"Caché de textos: {stats['hit_rate']:.0%} de aciertos ({stats['hits']}/{stats['hits'] + stats['misses']})")
+            stats = FONT_REGISTRY.stats()
+            logger.info(f"Fuentes: {stats['loads']} cargadas en {stats['load_time'] * 1000:.1f} ms, {stats['hits']} reutilizadas")
+        if etapas is not None:
+            for name, stats in self.metrics.pipeline.items():
+                logger.info(f"Etapa {name}: {stats['utilization']:.0%} ocupada ({stats['threads']} hilos), "
+                            f"cola media {stats['queue_mean']} (máx. {stats['queue_max']})")
+        logger.info("Proceso cancelado" if cancelado else "¡Proceso completado!")
+        return generados
+    
+    def _write_shard(self, csv_path, shard, filas_roster, filas_csv, registros, errores, save_png,
+                     merged_pdf, zip_path, complete):
+        """
+        Escribe shard.json en el directorio de salida: qué filas del CSV
+        tocaban a este fragmento, qué archivos generó cada una y si falló
+        """
+        filas = []
+        for fila, registro in zip(filas_csv, registros):
+            error = errores.get(id(registro), 'no procesada')
+            archivos = []
+            if error is None and merged_pdf is None:
+                # Con el PDF único la fila no tiene archivos propios
+                archivos = [rel_path for page, rel_path in self.output_paths(registro.safe_name).items()
+                            if save_png or page == 'pdf']
+            filas.append({'fila': fila, 'folio': registro.folio, 'nombre': _record_name(registro),
+                          'files': archivos, 'error': None if error is None else str(error)})
+        
+        _write_json(os.path.join(self.output_dir, SHARD_FILE), {
+            'shard': list(shard),
+            'csv_sha256': _file_hash(csv_path),
+            'roster_rows': filas_roster,
+            'complete': complete,
+            'merged_pdf': os.path.relpath(merged_pdf, self.output_dir) if merged_pdf else None,
+            'zip': os.path.relpath(zip_path, self.output_dir) if zip_path else None,
+            'rows': filas
+        })
+    
+    def _with_unchanged(self, sin_cambios, resultados, archive, save_png=True):
+        """
+        Antepone a los resultados las filas sin cambios, añadiendo al ZIP
+        sus archivos existentes; en las filas regeneradas en parte, añade
+        al ZIP las páginas que no se reescribieron. Sin save_png el ZIP
+        solo lleva los PDF, como en una generación completa.
+        """
+        for registro in sin_cambios:
+            if archive is not None:
+                for rel_path in self._existing_outputs(registro.safe_name, save_png):
+                    archive.write_file(f"{self.output_dir}/{rel_path}", rel_path)
+            yield registro, None
+        
+        for registro, error, pages in resultados:
+            if archive is not None and error is None and pages is not None:
+                for page, rel_path in self.output_paths(registro.safe_name).items():
+                    path = f"{self.output_dir}/{rel_path}"
+                    if (save_png or page == 'pdf') and page not in pages and os.path.exists(path):
+                        archive.write_file(path, rel_path)
+            yield registro, error
+    
+    def _existing_outputs(self, safe_name, save_png=True):
+        """Rutas relativas de los archivos de un estudiante que existen en disco (sin save_png, solo el PDF)"""
+        return [rel_path for page, rel_path in self.output_paths(safe_name).items()
+                if (save_png or page == 'pdf') and os.path.exists(f"{self.output_dir}/{rel_path}")]
+    
+    def _record_manifest(self, manifest, registro, huellas, save_png):
+        """Registra en el manifiesto las huellas y archivos de una fila terminada"""
+        entry = dict(huellas)
+        previous = manifest.get(registro.safe_name) or {}
+        rel_paths = self.output_paths(registro.safe_name)
+        if not save_png:
+            # Sin PNG solo siguen al día las páginas cuya huella no cambió;
+            # el PNG de una página que cambió es de datos anteriores y se borra
+            for page in ('portada', 'contraportada'):
+                if previous.get(page) != huellas[page]:
+                    entry.pop(page)
+        entry['files'] = [rel_paths[page] for page in PAGES
+                          if page in entry and os.path.exists(f"{self.output_dir}/{rel_paths[page]}")]
+        
+        # Archivos anteriores que ya no corresponden (por ejemplo, al cambiar de formato)
+        for rel_path in previous.get('files', []):
+            path = f"{self.output_dir}/{rel_path}"
+            if rel_path not in entry['files'] and os.path.exists(path):
+                os.remove(path)
+        manifest.record(registro.safe_name, entry)
+    
+    def _generate_serial(self, tareas, opciones):
+        """Procesa las filas una tras otra, devolviendo (registro, error, páginas) por fila"""
+        for registro, pages in tareas:
+            try:
+                self.process_row(registro, pages=pages, **opciones)
+                yield registro, None, pages
             except Exception as e:
-                print(f"Error procesando diploma para {row.get('nombre', 'desconocido')}: {e}")
+                yield registro, e, pages
+    
+    def row_pipeline(self, opciones, encode_threads=2, queue_depth=2):
+        """
+        Construye el Pipeline por etapas de una fila: 'render' (plantillas y
+        textos, un hilo porque usa las cachés), 'encode' (PNG/JPEG/WebP),
+        'pdf' y 'write' (archivos sueltos y ZIP, en orden). Cada elemento es
+        un diccionario con el registro, las páginas a escribir y lo que cada
+        etapa va produciendo.
+        
+        Args:
+            opciones (dict): save_png, pdf_mode, archive y write_files, como en process_row
+            encode_threads (int): Hilos de la etapa de codificación
+            queue_depth (int): Capacidad de cada cola entre etapas
+        """
+        save_png = opciones['save_png']
+        pdf_mode = opciones['pdf_mode']
+        archive = opciones['archive']
+        write_files = opciones['write_files']
+        
+        def render(fila):
+            registro = fila['registro']
+            nombre = _check_record(registro)
+            fila['paths'] = self.output_paths(registro.safe_name)
+            pages = fila['pages']
+            need_images = pdf_mode == 'raster' and 'pdf' in pages
+            for page, create in (('portada', lambda: self.create_portada(nombre, registro.folio)),
+                                 ('contraportada', lambda: self.create_contraportada(registro))):
+                if page in pages and save_png:
+                    fila['images'][page] = create()
+                    fila['save'].append(page)
+                elif need_images:
+                    fila['images'][page] = self._reusable_page(page, pages, save_png, fila['paths'][page]) or create()
+            if 'pdf' in pages and pdf_mode == 'vector':
+                # Los textos se miden aquí, en el único hilo que usa las cachés
+                fila['vector'] = self._pdf_vector_pages(registro)
+        
+        def encode(fila):
+            for page in fila['save']:
+                with self.metrics.stage('image_encode'):
+                    fila['encoded'][page] = self.encode_image(fila['images'][page])
+        
+        def pdf(fila):
+            if 'pdf' in fila['pages']:
+                images = fila['images']
+                encoded = fila['encoded']
+                buffer = io.BytesIO()
+                with self.metrics.stage('pdf_write'):
+                    if pdf_mode == 'vector':
+                        self._write_pdf_vector(fila['registro'], buffer, fila['vector'])
+                    else:
+                        self._write_pdf(self._pdf_image(images['portada'], encoded.get('portada')),
+                                        self._pdf_image(images['contraportada'], encoded.get('contraportada')),
+                                        buffer)
+                fila['pdf'] = buffer.getvalue()
+            # Las páginas ya no hacen falta: se liberan antes de la escritura
+            fila['images'] = None
+            fila['vector'] = None
+        
+        def write(fila):
+            for page in fila['save']:
+                self._store_output(f"{page.capitalize()} creada", fila['paths'][page],
+                                   fila['encoded'][page], archive, write_files)
+            if fila['pdf'] is not None:
+                self._store_output("PDF creado", fila['paths']['pdf'], fila['pdf'], archive, write_files)
+            fila['encoded'] = None
+            fila['pdf'] = None
+            logger.info(f"Diploma completado para: {_record_name(fila['registro'])}")
+        
+        return Pipeline([('render', render, 1), ('encode', encode, encode_threads),
+                         ('pdf', pdf, 1), ('write', write, 1)], depth=queue_depth)
+    
+    def _generate_pipelined(self, etapas, tareas):
+        """Procesa las filas con el Pipeline de row_pipeline, devolviendo (registro, error, páginas)"""
+        filas = ({'registro': registro, 'pages': set(PAGES) if pages is None else pages, 'requested': pages,
+                  'paths': None, 'images': {}, 'save': [], 'encoded': {}, 'vector': None, 'pdf': None}
+                 for registro, pages in tareas)
+        for fila, error in etapas.run(filas):
+            yield fila['registro'], error, fila['requested']
+    
+    def _generate_parallel(self, tareas, workers, opciones, archive=None):
+        """
+        Reparte las filas en bloques entre un pool de procesos. Cada proceso
+        carga fuentes y configuración una sola vez al arrancar; las
+        plantillas (y la contraportada con sus textos fijos) se decodifican
+        aquí y los procesos las comparten (ver SharedTemplates). Si hay ZIP,
+        los procesos dejan los archivos en disco (en el directorio de salida,
+        o en uno temporal si no se escriben sueltos) y aquí se añaden al ZIP
+        con write_file, sin pasar los bytes entre procesos (ver ArchiveFiles).
+        """
+        archive_dir = None
+        if archive is not None:
+            if opciones['write_files']:
+                archive_dir = self.output_dir
+            else:
+                os.makedirs(self.output_dir, exist_ok=True)
+                archive_dir = tempfile.mkdtemp(prefix='.zip_', dir=self.output_dir)
+                for subdir in ('png', 'pdf'):
+                    os.makedirs(os.path.join(archive_dir, subdir))
+        opciones = dict(opciones, archive_dir=archive_dir)
+        chunksize = max(1, math.ceil(len(tareas) / (workers * 4)))
+        chunks = [tareas[i:i + chunksize] for i in range(0, len(tareas), chunksize)]
+        
+        shared = SharedTemplates(self.output_dir)
+        try:
+            shared.add('portada', self.template_cache.get(self.portada_template))
+            shared.add('contraportada', self.template_cache.get(self.contraportada_template))
+            shared.add('contraportada_base', self._contraportada_base())
+            
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(self.get_config(), logger.getEffectiveLevel(),
+                                               shared.descriptor())) as executor:
+                futures = {executor.submit(_process_chunk, chunk, opciones): chunk for chunk in chunks}
+                try:
+                    for future in as_completed(futures):
+                        chunk = futures[future]
+                        try:
+                            resultados, metricas = future.result()
+                            self.metrics.merge(metricas)
+                        except Exception as e:
+                            # El proceso murió: se reporta el error en todas las filas del bloque
+                            resultados = [(e, []) for _ in chunk]
+                        for (registro, pages), (error, entries) in zip(chunk, resultados):
+                            for rel_path in entries:
+                                path = os.path.join(archive_dir, rel_path)
+                                if os.path.exists(path):
+                                    with self.metrics.stage('zip_write'):
+                                        archive.write_file(path, rel_path)
+                                    if not opciones['write_files']:
+                                        os.remove(path)
+                            yield registro, error, pages
+                finally:
+                    # Al cancelar, los bloques que aún no empezaron se descartan
+                    executor.shutdown(wait=False, cancel_futures=True)
+        finally:
+            shared.remove()
+            if archive_dir is not None and not opciones['write_files']:
+                shutil.rmtree(archive_dir, ignore_errors=True)
+
+
+# ============================================================
+# PROCESOS DE TRABAJO PARA LA GENERACIÓN EN PARALELO
+# ============================================================
+
+# Generador propio de cada proceso del pool, creado por _init_worker
+_worker_generator = None
+
+def _init_worker(config, log_level=logging.WARNING, shared=None):
+    """
+    Inicializa el proceso: avisos, fuentes, coordenadas y plantillas
+    decodificadas (las compartidas por el proceso principal, si las hay)
+    """
+    global _worker_generator
+    logging.basicConfig(level=log_level, format='%(message)s', stream=sys.stdout)
+    logger.setLevel(log_level)
+    _worker_generator = DiplomaGenerator.from_config(config)
+    if shared is None:
+        _worker_generator.template_cache.get(_worker_generator.portada_template)
+        _worker_generator.template_cache.get(_worker_generator.contraportada_template)
+        return
+    
+    images = SharedTemplates.attach(shared)
+    _worker_generator.template_cache.set(_worker_generator.portada_template, images['portada'])
+    _worker_generator.template_cache.set(_worker_generator.contraportada_template, images['contraportada'])
+    _worker_generator._set_contraportada_base(images['contraportada_base'])
+
+def _process_chunk(tareas, opciones):
+    """
+    Procesa un bloque de filas en el proceso de trabajo. Devuelve
+    ((error, archivos) por fila, en orden, y las métricas del bloque);
+    archivos son las rutas relativas de las entradas del ZIP, que quedan
+    en opciones['archive_dir'] (ver ArchiveFiles).
+    """
+    opciones = dict(opciones)
+    archive_dir = opciones.pop('archive_dir')
+    archive = None
+    if archive_dir is not None:
+        archive = ArchiveFiles(None if opciones['write_files'] else archive_dir)
+    
+    resultados = []
+    for registro, pages in tareas:
+        try:
+            _worker_generator.process_row(registro, archive=archive, pages=pages, **opciones)
+            resultados.append((None, archive.drain() if archive else []))
+        except Exception as e:
+            resultados.append((e, archive.drain() if archive else []))
+    return resultados, _worker_generator.metrics.drain()
+
+# ============================================================
+# UNIÓN DE FRAGMENTOS
+# ============================================================
+
+def merge_shards(shard_dirs, output_dir, zip_path=None, write_files=True):
+    """
+    Une las salidas de una generación repartida con shard=(i, N) en un solo
+    entregable. Antes de copiar nada comprueba que estén todos los
+    fragmentos del mismo CSV, que cada fila del CSV aparezca exactamente una
+    vez y sin error, y que existan todos sus archivos (sueltos o dentro del
+    ZIP del fragmento).
+    
+    Los PDF únicos de cada fragmento no se pueden concatenar sin una
+    biblioteca de lectura de PDF, así que se copian como partes numeradas
+    (pdf/<nombre>_parte_i_de_N.pdf).
+    
+    Args:
+        shard_dirs (list): Directorios de salida de los fragmentos
+        output_dir (str): Directorio del entregable
+        zip_path (str): Si se indica, escribe también el ZIP con todo
+        write_files (bool): Copiar los archivos sueltos; con False solo el ZIP
+    
+    Returns:
+        int: Número de filas unidas
+    """
+    if not write_files and zip_path is None:
+        raise ValueError("Sin archivos sueltos es necesario indicar zip_path")
+    
+    fragmentos = []
+    for shard_dir in shard_dirs:
+        path = os.path.join(shard_dir, SHARD_FILE)
+        if not os.path.exists(path):
+            raise ValueError(f"{shard_dir} no es la salida de un fragmento (falta {SHARD_FILE})")
+        with open(path, encoding='utf-8') as f:
+            fragmentos.append((shard_dir, json.load(f)))
+    
+    # Todos los fragmentos del mismo CSV, cada uno una sola vez
+    problemas = []
+    _, primero = fragmentos[0]
+    total_fragmentos = primero['shard'][1]
+    for shard_dir, info in fragmentos:
+        if (info['shard'][1], info['csv_sha256'], info['roster_rows']) != \
+                (total_fragmentos, primero['csv_sha256'], primero['roster_rows']):
+            problemas.append(f"{shard_dir}: fragmento de otro reparto o de otro CSV")
+        if not info['complete']:
+            problemas.append(f"{shard_dir}: la generación no terminó")
+    indices = sorted(info['shard'][0] for _, info in fragmentos)
+    for indice in sorted(set(range(1, total_fragmentos + 1)) - set(indices)):
+        problemas.append(f"Falta el fragmento {indice}/{total_fragmentos}")
+    for indice in sorted({i for i in indices if indices.count(i) > 1}):
+        problemas.append(f"Fragmento {indice}/{total_fragmentos} repetido")
+    
+    # Cada fila del CSV exactamente una vez, sin error y con todos sus archivos
+    vistas = {}
+    origenes = {}
+    for shard_dir, info in fragmentos:
+        zip_fragmento = os.path.join(shard_dir, info['zip']) if info['zip'] else None
+        en_zip = set()
+        if zip_fragmento and os.path.exists(zip_fragmento):
+            with zipfile.ZipFile(zip_fragmento) as zf:
+                en_zip = set(zf.namelist())
+        
+        def origen(rel_path):
+            """(ruta o nombre dentro del ZIP, ZIP o None) de un archivo del fragmento"""
+            if os.path.exists(os.path.join(shard_dir, rel_path)):
+                return os.path.join(shard_dir, rel_path), None
+            if rel_path in en_zip:
+                return rel_path, zip_fragmento
+            return None
         
-        print("¡Proceso completado!")
+        for row in info['rows']:
+            fila = row['fila']
+            if fila in vistas:
+                problemas.append(f"Fila {fila + 1} ({row['nombre']}) repetida en {vistas[fila]} y {shard_dir}")
+                continue
+            vistas[fila] = shard_dir
+            if row['error'] is not None:
+                problemas.append(f"Fila {fila + 1} ({row['nombre']}) con error en {shard_dir}: {row['error']}")
+            for rel_path in row['files']:
+                if rel_path in origenes:
+                    logger.warning(f"Advertencia: {rel_path} aparece en más de una fila; se conserva la última")
+                origenes[rel_path] = origen(rel_path)
+                if origenes[rel_path] is None:
+                    problemas.append(f"Fila {fila + 1} ({row['nombre']}): falta {rel_path} en {shard_dir}")
+        
+        if info['merged_pdf']:
+            stem = os.path.splitext(os.path.basename(info['merged_pdf']))[0]
+            rel_path = f"pdf/{stem}_parte_{info['shard'][0]}_de_{total_fragmentos}.pdf"
+            origenes[rel_path] = origen(info['merged_pdf']) or origen(f"pdf/{os.path.basename(info['merged_pdf'])}")
+            if origenes[rel_path] is None:
+                problemas.append(f"{shard_dir}: falta el PDF único {info['merged_pdf']}")
+    for fila in sorted(set(range(primero['roster_rows'])) - set(vistas)):
+        problemas.append(f"Fila {fila + 1} del CSV no está en ningún fragmento")
+    
+    if problemas:
+        for problema in problemas:
+            logger.error(f"Error: {problema}")
+        raise ValueError(f"No se pueden unir los fragmentos: {len(problemas)} problemas")
+    
+    os.makedirs(f"{output_dir}/png", exist_ok=True)
+    os.makedirs(f"{output_dir}/pdf", exist_ok=True)
+    archive = ArchiveWriter(zip_path) if zip_path is not None else None
+    abiertos = {}
+    try:
+        for rel_path, (source, zip_fragmento) in origenes.items():
+            if zip_fragmento is None:
+                if write_files:
+                    shutil.copyfile(source, f"{output_dir}/{rel_path}")
+                if archive is not None:
+                    archive.write_file(source, rel_path)
+                continue
+            if zip_fragmento not in abiertos:
+                abiertos[zip_fragmento] = zipfile.ZipFile(zip_fragmento)
+            data = abiertos[zip_fragmento].read(source)
+            if write_files:
+                _write_data(f"{output_dir}/{rel_path}", data)
+            if archive is not None:
+                archive.write(rel_path, data)
+        
+        # Manifiestos de los fragmentos generados con incremental
+        entradas = {}
+        for shard_dir, _ in fragmentos:
+            path = os.path.join(shard_dir, Manifest.FILENAME)
+            if os.path.exists(path):
+                with open(path, encoding='utf-8') as f:
+                    entradas.update(json.load(f).get('entries', {}))
+        if entradas and write_files:
+            _write_json(os.path.join(output_dir, Manifest.FILENAME), {'version': 1, 'entries': entradas})
+    finally:
+        for zf in abiertos.values():
+            zf.close()
+        if archive is not None:
+            archive.close()
+            logger.info(f"ZIP creado: {zip_path}")
+    
+    logger.info(f"Fragmentos unidos: {len(fragmentos)}, {len(vistas)} filas, {len(origenes)} archivos")
+    return len(vistas)
+
+
+def _parse_shard(value):
+    """Convierte 'i/N' en (i, N) para --shard"""
+    try:
+        indice, fragmentos = (int(parte) for parte in value.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"se esperaba i/N, por ejemplo 1/4: {value}")
+    if not 1 <= indice <= fragmentos:
+        raise argparse.ArgumentTypeError(f"i debe estar entre 1 y N: {value}")
+    return indice, fragmentos
+
+
+def main_merge(argv):
+    parser = argparse.ArgumentParser(prog='diploma_generator.py merge',
+                                     description='Une las salidas de una generación repartida con --shard')
+    parser.add_argument('fragmentos', nargs='+', help='Directorios de salida de cada fragmento')
+    parser.add_argument('--output', required=True, help='Directorio del entregable')
+    parser.add_argument('--zip', metavar='RUTA', help='Escribir también un ZIP con todo')
+    parser.add_argument('--solo-zip', action='store_true', help='Escribir solo el ZIP, sin archivos sueltos')
+    parser.add_argument('--log-level', default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
+                        help='Nivel de detalle de los avisos en consola')
+    
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=args.log_level, format='%(message)s', stream=sys.stdout)
+    
+    if args.solo_zip and not args.zip:
+        print("Error: --solo-zip requiere --zip")
+        return
+    
+    try:
+        merge_shards(args.fragmentos, args.output, zip_path=args.zip, write_files=not args.solo_zip)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
 
 def main():
+    if sys.argv[1:2] == ['merge']:
+        return main_merge(sys.argv[2:])
+    
     parser = argparse.ArgumentParser(description='Generador de Diplomas Automatizado')
-    parser.add_argument('--csv', required=True, help='Ruta del archivo CSV con los datos')
+    parser.add_argument('--csv', '--datos', dest='csv', required=True,
+                        help='Ruta del archivo de datos: CSV, Parquet, Feather/Arrow o XLSX')
     parser.add_argument('--portada', required=True, help='Ruta del template de portada PNG')
     parser.add_argument('--contraportada', required=True, help='Ruta del template de contraportada PNG')
     parser.add_argument('--output', default='diplomas_generados', help='Directorio de salida')
+    parser.add_argument('--workers', type=int, default=1, help='Número de procesos en paralelo')
+    parser.add_argument('--solo-pdf', action='store_true', help='Generar solo los PDF, sin guardar los PNG')
+    parser.add_argument('--pdf-unico', metavar='RUTA', help='Generar un único PDF con todos los diplomas')
+    parser.add_argument('--pdf-vectorial', action='store_true',
+                        help='Dibujar el texto de los PDF como vectores con las fuentes incrustadas')
+    parser.add_argument('--zip', metavar='RUTA', help='Escribir los diplomas en un ZIP a medida que se generan')
+    parser.add_argument('--solo-zip', action='store_true', help='Escribir solo el ZIP, sin archivos sueltos')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Regenerar solo los diplomas que cambiaron desde la última ejecución')
+    parser.add_argument('--formato', choices=list(IMAGE_EXTENSIONS), default='png',
+                        help='Formato de las imágenes de cada página')
+    parser.add_argument('--compresion-png', type=int, default=6, choices=range(10), metavar='0-9',
+                        help='Nivel de compresión PNG (menos = más rápido, archivos más grandes)')
+    parser.add_argument('--reducir-colores', choices=['rgb', 'paleta'],
+                        help='Guardar los PNG sin canal alfa si son opacos (rgb) o con 256 colores (paleta)')
+    parser.add_argument('--calidad', type=int, default=90, help='Calidad JPEG/WebP (1-95)')
+    parser.add_argument('--pdf-jpeg', action='store_true',
+                        help='Incrustar las páginas del PDF como JPEG, sin recompresión')
+    parser.add_argument('--por-etapas', action='store_true',
+                        help='Generar por etapas (render, codificación, PDF, escritura) con colas acotadas')
+    parser.add_argument('--hilos-codificacion', type=int, default=2,
+                        help='Hilos de la etapa de codificación con --por-etapas')
+    parser.add_argument('--profundidad-cola', type=int, default=2,
+                        help='Capacidad de las colas entre etapas con --por-etapas')
+    parser.add_argument('--shard', type=_parse_shard, metavar='i/N',
+                        help='Generar solo el fragmento i de N (por folio); unir después con "merge"')
+    parser.add_argument('--metrics', metavar='RUTA', help='Guardar en JSON los tiempos por etapa, bytes y filas')
+    parser.add_argument('--log-level', default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
+                        help='Nivel de detalle de los avisos en consola')
     
     args = parser.parse_args()
+    logging.basicConfig(level=args.log_level, format='%(message)s', stream=sys.stdout)
     
     if not os.path.exists(args.csv):
-        print(f"Error: No se encuentra el archivo CSV: {args.csv}")
+        print(f"Error: No se encuentra el archivo de datos: {args.csv}")
         return
     
     if not os.path.exists(args.portada):
@@ -404,8 +2851,38 @@ def main():
         print(f"Error: No se encuentra el template de contraportada: {args.contraportada}")
         return
     
+    if args.workers < 1:
+        print("Error: --workers debe ser al menos 1")
+        return
+    
+    if args.solo_zip and not args.zip:
+        print("Error: --solo-zip requiere --zip")
+        return
+    
+    if args.por_etapas and (args.workers > 1 or args.pdf_unico):
+        print("Error: --por-etapas no se combina con --workers ni con --pdf-unico")
+        return
+    
+    if args.hilos_codificacion < 1 or args.profundidad_cola < 1:
+        print("Error: --hilos-codificacion y --profundidad-cola deben ser al menos 1")
+        return
+    
     generator = DiplomaGenerator(args.portada, args.contraportada, args.output)
-    generator.generate_diplomas(args.csv)
+    generator.set_output_config(format=args.formato, compress_level=args.compresion_png,
+                                reduce={'rgb': 'rgb', 'paleta': 'palette'}.get(args.reducir_colores, 'none'),
+                                quality=args.calidad, pdf_jpeg=args.pdf_jpeg)
+    generator.generate_diplomas(args.csv, workers=args.workers, save_png=not args.solo_pdf,
+                                merged_pdf=args.pdf_unico,
+                                pdf_mode='vector' if args.pdf_vectorial else 'raster',
+                                zip_path=args.zip, write_files=not args.solo_zip,
+                                incremental=args.incremental, pipeline=args.por_etapas,
+                                encode_threads=args.hilos_codificacion, queue_depth=args.profundidad_cola,
+                                shard=args.shard)
+    
+    if args.metrics:
+        with open(args.metrics, 'w', encoding='utf-8') as f:
+            json.dump(dict(generator.metrics.summary(), caches=generator.get_cache_stats()), f, indent=2)
+        logger.info(f"Métricas guardadas en: {args.metrics}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
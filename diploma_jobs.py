@@ -0,0 +1,201 @@
+import os
+import re
+import shutil
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Job:
+    """
+    Estado de una generación en segundo plano
+
+    El hilo de trabajo solo actualiza atributos; la interfaz los consulta
+    cuando quiere (no se envía nada a Streamlit desde el hilo).
+    """
+
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    CANCELLED = 'cancelled'
+    FAILED = 'failed'
+
+    def __init__(self, job_id, info=None):
+        self.id = job_id
+        self.info = dict(info or {})
+        self.status = self.PENDING
+        self.completed = 0
+        self.total = 0
+        self.current = None
+        self.errors = []
+        self.result = None
+        self.error = None
+        self.traceback = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.cancel_event = threading.Event()
+        self.future = None
+
+    def progress(self, completados, total, nombre, error):
+        """Callback compatible con DiplomaGenerator.generate_diplomas"""
+        self.completed = completados
+        self.total = total
+        self.current = nombre
+        if error is not None:
+            self.errors.append((nombre, str(error)))
+
+    @property
+    def active(self):
+        return self.status in (self.PENDING, self.RUNNING)
+
+    @property
+    def rate(self):
+        """Diplomas por segundo desde que empezó el trabajo"""
+        if self.started is None:
+            return 0.0
+        elapsed = (self.finished or time.time()) - self.started
+        return self.completed / elapsed if elapsed > 0 else 0.0
+
+
+class JobRunner:
+    """
+    Ejecuta generaciones en hilos de fondo y conserva su estado por id, de
+    modo que la página puede consultarlas (o recuperarlas tras recargar)
+    sin bloquear la sesión. Como mucho corren max_workers trabajos a la vez
+    entre todas las sesiones; el resto espera en cola.
+    """
+
+    def __init__(self, max_workers=1):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='diplomas')
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, fn, **info):
+        """
+        Encola un trabajo
+
+        Args:
+            fn (callable): Función llamada como fn(job); debe pasar
+                job.progress y job.cancel_event a generate_diplomas
+            **info: Datos que se guardan en job.info (rutas de salida, etc.)
+
+        Returns:
+            Job: Trabajo creado
+        """
+        job = Job(uuid.uuid4().hex[:12], info)
+
+        def run():
+            if job.cancel_event.is_set():
+                job.status = Job.CANCELLED
+                job.finished = time.time()
+                return
+            job.status = Job.RUNNING
+            job.started = time.time()
+            try:
+                job.result = fn(job)
+                job.status = Job.CANCELLED if job.cancel_event.is_set() else Job.DONE
+            except Exception as e:
+                job.error = e
+                job.traceback = traceback.format_exc()
+                job.status = Job.FAILED
+            finally:
+                job.finished = time.time()
+
+        with self._lock:
+            self._jobs[job.id] = job
+        job.future = self._executor.submit(run)
+        return job
+
+    def get(self, job_id):
+        """Devuelve el trabajo con ese id, o None si no existe"""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        """Pide la cancelación; el trabajo se detiene tras la fila en curso"""
+        job = self.get(job_id)
+        if job is not None and job.active:
+            job.cancel_event.set()
+        return job
+
+    def active_workspaces(self):
+        """Espacios de trabajo con un trabajo pendiente o en curso"""
+        with self._lock:
+            return {job.info.get('workspace') for job in self._jobs.values() if job.active}
+
+    def prune(self, max_age):
+        """Olvida los trabajos terminados hace más de max_age segundos"""
+        limit = time.time() - max_age
+        with self._lock:
+            for job_id in [job_id for job_id, job in self._jobs.items()
+                           if not job.active and job.finished is not None and job.finished < limit]:
+                del self._jobs[job_id]
+
+
+class WorkspaceManager:
+    """
+    Directorios de trabajo aislados por sesión, con sus archivos subidos y
+    su salida, para que varias sesiones generen a la vez sin pisarse. Un
+    directorio sin usar durante ttl segundos se elimina, salvo que tenga un
+    trabajo activo.
+    """
+
+    MARKER = '.ultimo_uso'
+
+    def __init__(self, root='workspaces', ttl=6 * 3600, cleanup_interval=60):
+        self.root = os.path.abspath(root)
+        self.ttl = ttl
+        self.cleanup_interval = cleanup_interval
+        self._last_cleanup = 0.0
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+
+    @staticmethod
+    def new_id():
+        return uuid.uuid4().hex
+
+    @staticmethod
+    def valid_id(workspace_id):
+        return isinstance(workspace_id, str) and re.fullmatch(r'[0-9a-f]{32}', workspace_id) is not None
+
+    def path(self, workspace_id):
+        """Devuelve (y crea si hace falta) el directorio de la sesión, marcándolo como usado"""
+        if not self.valid_id(workspace_id):
+            raise ValueError(f"Id de espacio de trabajo no válido: {workspace_id}")
+        path = os.path.join(self.root, workspace_id)
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, self.MARKER), 'w') as f:
+            f.write(str(time.time()))
+        return path
+
+    def cleanup(self, active=()):
+        """
+        Elimina los espacios caducados (como mucho una vez por cleanup_interval)
+
+        Args:
+            active (iterable): Rutas de espacios con trabajos activos, que se conservan
+
+        Returns:
+            list: Rutas eliminadas
+        """
+        now = time.time()
+        with self._lock:
+            if now - self._last_cleanup < self.cleanup_interval:
+                return []
+            self._last_cleanup = now
+
+        active = set(active)
+        removed = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if not self.valid_id(name) or path in active:
+                continue
+            marker = os.path.join(path, self.MARKER)
+            last_used = os.path.getmtime(marker) if os.path.exists(marker) else os.path.getmtime(path)
+            if now - last_used > self.ttl:
+                shutil.rmtree(path, ignore_errors=True)
+                removed.append(path)
+        return removed
@@ -0,0 +1,27 @@
+import csv
+import os
+import sys
+
+import pytest
+from PIL import Image
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def write_csv(path, rows):
+    """Escribe rows (la primera es la cabecera) como CSV UTF-8"""
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        csv.writer(f).writerows(rows)
+    return str(path)
+
+
+@pytest.fixture
+def templates(tmp_path):
+    """Portada y contraportada lisas del tamaño de las plantillas reales (A4 a 150 ppp)"""
+    paths = []
+    for name, color in (('portada.png', (250, 245, 230)), ('contraportada.png', (230, 240, 250))):
+        path = tmp_path / name
+        Image.new('RGB', (1240, 1754), color).save(path)
+        paths.append(str(path))
+    return paths
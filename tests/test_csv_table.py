@@ -0,0 +1,64 @@
+import random
+import subprocess
+import sys
+
+import pandas as pd
+
+from conftest import ROOT, write_csv
+from diploma_generator import CsvTable, DiplomaGenerator
+
+HEADER = ['nombre', 'folio', 'modulo1_calificacion', 'modulo2_calificacion',
+          'modulo3_calificacion', 'modulo4_calificacion', 'extra']
+
+# Valores que CsvTable lee sin recurrir a pandas
+VALUES = ['', '7', '007', '-3', '+4', '9.5', '-7.125', '1e2', '1.5e300', '.5', '3.',
+          '10', 'NP', 'A', 'José Ñ', 'x y', 'a,b']
+
+
+def records(generator, table):
+    # repr para que NaN == NaN al comparar
+    return [repr(tuple(registro)) for registro in generator.prepare_records(table)]
+
+
+def assert_same_records(path):
+    generator = DiplomaGenerator.__new__(DiplomaGenerator)
+    table = CsvTable.read(path)
+    assert table is not None
+    df = pd.read_csv(path)
+    assert len(table) == len(df)
+    assert list(table.columns) == list(df.columns)
+    assert records(generator, table) == records(generator, df)
+
+
+def test_records_match_pandas(tmp_path):
+    rows = [HEADER,
+            ['Juan Pérez', '001', '8.7', '10', '9', '9.5', 'x'],
+            ['María García', '002', '', '10', '9', 'NP', ''],
+            ['José Ñúñez', '010', '7.25', '', '9', '', 'a,b'],
+            ['Li "Wei"', '011', '10', '8', '9', '6', '']]
+    assert_same_records(write_csv(tmp_path / 'datos.csv', rows))
+
+
+def test_records_match_pandas_random(tmp_path):
+    rng = random.Random(23)
+    for n in range(200):
+        header = HEADER[:2] + [column for column in HEADER[2:] if rng.random() < 0.8]
+        rows = [header] + [[rng.choice(VALUES) for _ in header] for _ in range(rng.randint(1, 6))]
+        assert_same_records(write_csv(tmp_path / f'datos{n}.csv', rows))
+
+
+def test_doubtful_values_fall_back_to_pandas(tmp_path):
+    for n, value in enumerate(['NA', 'True', ' 9', 'inf', '1_0', '-0.0', '99999999999999999999']):
+        path = write_csv(tmp_path / f'datos{n}.csv', [HEADER[:3], ['Ana', '1', value]])
+        assert CsvTable.read(path) is None
+
+
+def test_small_csv_does_not_import_pandas(tmp_path, templates):
+    csv_path = write_csv(tmp_path / 'datos.csv', [HEADER[:4], ['Ana', '1', '9', '10']])
+    code = (f"import sys; sys.path.insert(0, {ROOT!r})\n"
+            "from diploma_generator import DiplomaGenerator\n"
+            f"DiplomaGenerator({templates[0]!r}, {templates[1]!r}, {str(tmp_path / 'salida')!r})"
+            f".generate_diplomas({csv_path!r})\n"
+            "print('pandas' in sys.modules)")
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+    assert result.stdout.split()[-1] == 'False'
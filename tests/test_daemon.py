@@ -0,0 +1,83 @@
+import json
+import os
+import signal
+import threading
+import time
+from concurrent.futures.process import BrokenProcessPool
+
+import diploma_daemon
+from conftest import write_csv
+from diploma_daemon import SpoolDaemon, enviar_trabajo
+
+ejecutar_trabajo = diploma_daemon.ejecutar_trabajo
+
+
+def trabajo(job_id, manifest_path, spool):
+    """ejecutar_trabajo, salvo el trabajo 'choca', cuyo proceso muere a mitad"""
+    if job_id == 'choca':
+        with open(os.path.join(spool, 'estado', f"{job_id}.json"), 'w', encoding='utf-8') as f:
+            json.dump({'id': job_id, 'state': 'running', 'pid': os.getpid()}, f)
+        os.kill(os.getpid(), signal.SIGKILL)
+    return ejecutar_trabajo(job_id, manifest_path, spool)
+
+
+class BrokenExecutor:
+    """Grupo de procesos que ya se rompió: no acepta trabajos"""
+
+    def submit(self, *args, **kwargs):
+        raise BrokenProcessPool("proceso terminado")
+
+    def shutdown(self, wait=True):
+        pass
+
+
+def serve_until(daemon, *paths):
+    """Ejecuta el servicio hasta que existan todas las rutas (o 60 s)"""
+    def vigilar():
+        limite = time.time() + 60
+        while time.time() < limite and not all(os.path.exists(path) for path in paths):
+            time.sleep(0.1)
+        daemon.stop()
+    threading.Thread(target=vigilar, daemon=True).start()
+    daemon.serve()
+
+
+def state(spool, job_id):
+    with open(os.path.join(spool, 'estado', f"{job_id}.json"), encoding='utf-8') as f:
+        return json.load(f)['state']
+
+
+def job(tmp_path, templates):
+    csv_path = write_csv(tmp_path / 'datos.csv', [['nombre', 'folio', 'modulo1_calificacion'], ['Ana', '1', '9']])
+    return {'csv': csv_path, 'portada': templates[0], 'contraportada': templates[1],
+            'options': {'save_png': False}}
+
+
+def test_worker_crash_restarts_pool(tmp_path, templates, monkeypatch):
+    monkeypatch.setattr(diploma_daemon, 'ejecutar_trabajo', trabajo)
+    spool = str(tmp_path / 'cola')
+    enviar_trabajo(spool, job(tmp_path, templates), 'choca')
+    os.utime(os.path.join(spool, 'entrada', 'choca.json'), (0, 0))
+    enviar_trabajo(spool, job(tmp_path, templates), 'normal')
+
+    serve_until(SpoolDaemon(spool, concurrency=1, interval=0.1), os.path.join(spool, 'terminados', 'normal.json'))
+
+    assert os.listdir(os.path.join(spool, 'fallidos')) == ['choca.json']
+    assert os.listdir(os.path.join(spool, 'terminados')) == ['normal.json']
+    assert os.listdir(os.path.join(spool, 'en_proceso')) == []
+    assert state(spool, 'choca') == 'failed'
+    assert state(spool, 'normal') == 'done'
+
+
+def test_broken_pool_on_submit_requeues_job(tmp_path, templates):
+    spool = str(tmp_path / 'cola')
+    enviar_trabajo(spool, job(tmp_path, templates), 'normal')
+    daemon = SpoolDaemon(spool, concurrency=1, interval=0.1)
+    executors = [BrokenExecutor(), daemon._new_executor()]
+    daemon._new_executor = lambda: executors.pop(0)
+
+    serve_until(daemon, os.path.join(spool, 'terminados', 'normal.json'))
+
+    assert os.listdir(os.path.join(spool, 'terminados')) == ['normal.json']
+    assert os.listdir(os.path.join(spool, 'en_proceso')) == []
+    assert state(spool, 'normal') == 'done'
@@ -0,0 +1,82 @@
+import base64
+import json
+import os
+import re
+import zipfile
+import zlib
+
+import pytest
+from PIL import Image
+
+from conftest import write_csv
+from diploma_generator import DiplomaGenerator
+
+HEADER = ['nombre', 'folio', 'modulo1_calificacion', 'modulo2_calificacion',
+          'modulo3_calificacion', 'modulo4_calificacion']
+ROWS = [['Juan Pérez', '001', '8.7', '8.8', '9', '9.1'],
+        ['María García', '002', '10', '8.8', '9', 'NP'],
+        ['Ana', '003', '7.25', '8.8', '9', '9.1']]
+
+IMAGE_RE = re.compile(rb'<<([^>]*/Subtype /Image[^>]*)>>\s*stream\r?\n(.*?)endstream', re.S)
+
+
+def pdf_pages(path):
+    """Píxeles RGB de las imágenes de página de un PDF raster, en orden"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    pages = []
+    for header, stream in IMAGE_RE.findall(data):
+        stream = stream.strip()
+        if b'/ASCII85Decode' in header:
+            stream = base64.a85decode(stream.removesuffix(b'~>'))
+        pages.append(zlib.decompress(stream))
+    return pages
+
+
+def png_pixels(path):
+    with Image.open(path) as img:
+        return img.convert('RGB').tobytes()
+
+
+def generate(templates, output_dir, csv_path, **kwargs):
+    generator = DiplomaGenerator(templates[0], templates[1], str(output_dir))
+    assert generator.generate_diplomas(csv_path, **kwargs) == len(ROWS)
+
+
+@pytest.mark.parametrize('save_png', [True, False])
+def test_rerun_after_grade_change(tmp_path, templates, save_png):
+    output = tmp_path / 'salida'
+    csv_path = write_csv(tmp_path / 'datos.csv', [HEADER] + ROWS)
+    generate(templates, output, csv_path, incremental=True)
+
+    anterior = png_pixels(output / 'png' / 'Juan Pérez_contraportada.png')
+    sin_cambios = output / 'pdf' / 'María García_diploma.pdf'
+    mtime = os.stat(sin_cambios).st_mtime_ns
+
+    rows = [row[:] for row in ROWS]
+    rows[0][2:] = ['5.5', '6.5', '7', '4.5']
+    write_csv(tmp_path / 'datos.csv', [HEADER] + rows)
+    zip_path = str(tmp_path / 'diplomas.zip')
+    generate(templates, output, csv_path, incremental=True, save_png=save_png, zip_path=zip_path)
+
+    # Referencia: todo generado desde cero con las calificaciones nuevas
+    referencia = tmp_path / 'referencia'
+    generate(templates, referencia, csv_path)
+    esperado = [png_pixels(referencia / 'png' / f'Juan Pérez_{page}.png') for page in ('portada', 'contraportada')]
+    assert esperado[1] != anterior
+    assert pdf_pages(output / 'pdf' / 'Juan Pérez_diploma.pdf') == esperado
+    assert os.stat(sin_cambios).st_mtime_ns == mtime
+
+    with open(output / 'manifest.json', encoding='utf-8') as f:
+        entry = json.load(f)['entries']['Juan Pérez']
+    names = zipfile.ZipFile(zip_path).namelist()
+    if save_png:
+        assert png_pixels(output / 'png' / 'Juan Pérez_contraportada.png') == esperado[1]
+        assert 'png/Juan Pérez_contraportada.png' in entry['files']
+    else:
+        # Sin PNG: el ZIP y el manifiesto no deben incluir páginas de datos anteriores
+        assert not [name for name in names if name.endswith('.png')]
+        assert 'png/Juan Pérez_contraportada.png' not in entry['files']
+        assert not os.path.exists(output / 'png' / 'Juan Pérez_contraportada.png')
+    assert sorted(name for name in names if name.endswith('.pdf')) == \
+        sorted(f'pdf/{row[0]}_diploma.pdf' for row in ROWS)
@@ -0,0 +1,38 @@
+import re
+import threading
+import zipfile
+
+import pytest
+
+from conftest import write_csv
+from diploma_generator import DiplomaGenerator
+
+HEADER = ['nombre', 'folio', 'modulo1_calificacion', 'modulo2_calificacion']
+
+
+def page_count(data):
+    return int(re.search(rb'/Count (\d+)', data).group(1))
+
+
+@pytest.mark.parametrize('write_files', [True, False])
+def test_cancelled_merged_pdf_keeps_processed_rows(tmp_path, templates, write_files):
+    csv_path = write_csv(tmp_path / 'datos.csv',
+                         [HEADER] + [[f'Estudiante {i}', str(i), '9', '10'] for i in range(12)])
+    merged = tmp_path / 'salida' / 'todos.pdf'
+    zip_path = tmp_path / 'diplomas.zip'
+    cancel_event = threading.Event()
+
+    def progreso(completados, total, nombre, error):
+        if completados == 3:
+            cancel_event.set()
+
+    generados = DiplomaGenerator(templates[0], templates[1], str(tmp_path / 'salida')).generate_diplomas(
+        csv_path, merged_pdf=str(merged), zip_path=str(zip_path), write_files=write_files,
+        cancel_event=cancel_event, progress_callback=progreso)
+
+    assert generados == 3
+    with zipfile.ZipFile(zip_path) as z:
+        data = z.read('pdf/todos.pdf')
+    assert page_count(data) == 6
+    if write_files:
+        assert merged.read_bytes() == data
@@ -0,0 +1,51 @@
+import os
+import zipfile
+
+import pytest
+
+from conftest import write_csv
+from diploma_generator import ArchiveFiles, DiplomaGenerator
+
+HEADER = ['nombre', 'folio', 'modulo1_calificacion', 'modulo2_calificacion']
+ROWS = [['Juan Pérez', '001', '8.7', '10'],
+        ['María García', '002', '10', 'NP'],
+        ['Ana', '003', '7.25', '9'],
+        ['Li Wei', '004', '9.5', '8']]
+
+
+def zip_contents(path):
+    with zipfile.ZipFile(path) as z:
+        return {name: z.read(name) for name in z.namelist()}
+
+
+def test_archive_files_keeps_only_paths(tmp_path):
+    (tmp_path / 'png').mkdir()
+    archive = ArchiveFiles(str(tmp_path))
+    archive.write('png/a.png', b'datos')
+    assert archive.drain() == ['png/a.png']
+    assert archive.drain() == []
+    assert (tmp_path / 'png' / 'a.png').read_bytes() == b'datos'
+
+
+@pytest.mark.parametrize('write_files', [True, False])
+def test_parallel_zip_matches_serial(tmp_path, templates, write_files):
+    csv_path = write_csv(tmp_path / 'datos.csv', [HEADER] + ROWS)
+    serie = tmp_path / 'serie.zip'
+    DiplomaGenerator(templates[0], templates[1], str(tmp_path / 'serie')).generate_diplomas(
+        csv_path, zip_path=str(serie))
+
+    output = tmp_path / 'paralelo'
+    paralelo = tmp_path / 'paralelo.zip'
+    generados = DiplomaGenerator(templates[0], templates[1], str(output)).generate_diplomas(
+        csv_path, workers=2, zip_path=str(paralelo), write_files=write_files)
+
+    assert generados == len(ROWS)
+    esperado = zip_contents(serie)
+    obtenido = zip_contents(paralelo)
+    assert sorted(obtenido) == sorted(esperado)
+    assert all(obtenido[name] == esperado[name] for name in esperado if not name.endswith('.pdf'))
+    # Sin archivos sueltos no queda nada del directorio temporal de los procesos
+    quedan = sorted(os.listdir(output))
+    assert quedan == (sorted(os.listdir(tmp_path / 'serie')) if write_files else ['pdf', 'png'])
+    if not write_files:
+        assert os.listdir(output / 'png') == os.listdir(output / 'pdf') == []
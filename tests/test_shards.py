@@ -0,0 +1,84 @@
+import json
+import os
+import zipfile
+
+import pytest
+
+from conftest import write_csv
+from diploma_generator import SHARD_FILE, DiplomaGenerator, merge_shards
+
+HEADER = ['nombre', 'folio', 'modulo1_calificacion', 'modulo2_calificacion']
+ROWS = [[f'Estudiante {i}', f'{i:03d}', '9', str(6 + i % 5)] for i in range(9)]
+
+
+def generate_shards(tmp_path, templates, csv_path, prefix='fragmento'):
+    """Reparte el CSV en 3 fragmentos; el segundo solo escribe su ZIP (--solo-zip)"""
+    dirs = []
+    for indice in (1, 2, 3):
+        output = str(tmp_path / f'{prefix}{indice}')
+        opciones = {}
+        if indice == 2:
+            opciones = {'zip_path': os.path.join(output, 'fragmento.zip'), 'write_files': False}
+        generator = DiplomaGenerator(templates[0], templates[1], output)
+        generator.generate_diplomas(csv_path, shard=(indice, 3), **opciones)
+        with open(os.path.join(output, SHARD_FILE), encoding='utf-8') as f:
+            assert json.load(f)['rows'], f"el fragmento {indice} no tiene filas"
+        dirs.append(output)
+    return dirs
+
+
+@pytest.fixture
+def shards(tmp_path, templates):
+    csv_path = write_csv(tmp_path / 'datos.csv', [HEADER] + ROWS)
+    return generate_shards(tmp_path, templates, csv_path)
+
+
+def test_merge_all_shards(tmp_path, shards):
+    output = tmp_path / 'entregable'
+    zip_path = tmp_path / 'entregable.zip'
+    assert merge_shards(shards, str(output), zip_path=str(zip_path)) == len(ROWS)
+
+    esperados = sorted(f'{kind}/{row[0]}_{page}'
+                       for row in ROWS
+                       for kind, page in (('png', 'portada.png'), ('png', 'contraportada.png'),
+                                          ('pdf', 'diploma.pdf')))
+    assert sorted(f'{kind}/{name}' for kind in ('png', 'pdf') for name in os.listdir(output / kind)) == esperados
+    with zipfile.ZipFile(zip_path) as z:
+        assert sorted(z.namelist()) == esperados
+
+
+def test_merge_rejects_missing_shard(tmp_path, shards):
+    with pytest.raises(ValueError):
+        merge_shards([shards[0], shards[2]], str(tmp_path / 'entregable'))
+    assert not os.path.exists(tmp_path / 'entregable')
+
+
+def test_merge_rejects_repeated_shard(tmp_path, shards):
+    with pytest.raises(ValueError):
+        merge_shards(shards + [shards[0]], str(tmp_path / 'entregable'))
+
+
+def test_merge_rejects_shard_from_other_csv(tmp_path, templates, shards):
+    otro_csv = write_csv(tmp_path / 'otro.csv', [HEADER] + ROWS[:-1])
+    otros = generate_shards(tmp_path, templates, otro_csv, prefix='otro')
+    with pytest.raises(ValueError):
+        merge_shards([shards[0], shards[1], otros[2]], str(tmp_path / 'entregable'))
+
+
+def test_merge_rejects_lost_row(tmp_path, shards):
+    path = os.path.join(shards[0], SHARD_FILE)
+    with open(path, encoding='utf-8') as f:
+        info = json.load(f)
+    assert info['rows']
+    info['rows'].pop()
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(info, f)
+    with pytest.raises(ValueError):
+        merge_shards(shards, str(tmp_path / 'entregable'))
+
+
+def test_merge_rejects_missing_file(tmp_path, shards):
+    # Sin el ZIP del fragmento 2 sus archivos no están ni en disco ni en el ZIP
+    os.remove(os.path.join(shards[1], 'fragmento.zip'))
+    with pytest.raises(ValueError):
+        merge_shards(shards, str(tmp_path / 'entregable'))